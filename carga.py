@@ -0,0 +1,401 @@
+# carga.py
+# Prueba de carga local: sesiones simuladas de despachadores contra la app de
+# Streamlit (por su websocket, igual que un navegador) y clientes contra
+# cualquier endpoint HTTP. Las llegadas son de Poisson con tasa configurable
+# por escenario.
+#
+# Uso:
+#   python carga.py --iniciar --escenario caso_predefinido:2 --escenario clustering:1 --duracion 60
+#   python carga.py --url http://localhost:8501 --escenario http:20 --http-url http://localhost:8000/predecir
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.NumberInput_pb2 import NumberInput
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.websocket import websocket_connect
+
+WIDGETS = ("selectbox", "radio", "number_input", "slider", "text_input", "time_input", "button")
+
+MODO_CASOS = "📋 Casos Predefinidos"
+MODULO_CLUSTERING = "📈 Clustering + PCA de Conductores"
+BOTON_PREDECIR = "🔮 Predecir Entrega"
+BOTON_ANALIZAR = "📈 Analizar Conductor"
+
+# Mensajes st.error con los que la app muestra un resultado, no una falla
+RESULTADOS_EN_ERROR = ("❌ Llegará tarde", "Requiere atención inmediata")
+
+OPCIONES_ENTRADA = {
+    "Clima": ["Bueno", "Lluvia", "Tormenta"],
+    "TraficoPico": ["Bajo", "Medio", "Alto"],
+    "RiesgoRuta": ["Bajo", "Medio", "Alto"],
+    "TipoCarga": ["Normal", "Fragil", "Peligrosa"],
+    "FallasMecanicas": ["No", "Si"],
+    "HorarioSalida": ["Manana", "Tarde", "Noche"],
+}
+
+
+class ErrorSesion(Exception):
+    pass
+
+
+class SesionStreamlit:
+    """Un navegador mínimo: mantiene el estado de los widgets y provoca reruns."""
+
+    def __init__(self, url, timeout=60):
+        self.url_ws = url.replace("http", "ws", 1).rstrip("/") + "/_stcore/stream"
+        self.timeout = timeout
+        self.widgets = {}
+        self.estados = {}
+
+    async def __aenter__(self):
+        self.ws = await asyncio.wait_for(websocket_connect(self.url_ws), self.timeout)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.ws.close()
+
+    async def rerun(self, disparadores=()):
+        """Ejecuta el script con el estado actual y espera a que termine."""
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        for id_widget, (campo, valor) in self.estados.items():
+            estado = msg.rerun_script.widget_states.widgets.add()
+            estado.id = id_widget
+            if campo == "double_array_value":
+                estado.double_array_value.data.extend(valor)
+            else:
+                setattr(estado, campo, valor)
+        for id_widget in disparadores:
+            estado = msg.rerun_script.widget_states.widgets.add()
+            estado.id = id_widget
+            estado.trigger_value = True
+
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+        self.widgets = {}
+        while True:
+            crudo = await asyncio.wait_for(self.ws.read_message(), self.timeout)
+            if crudo is None:
+                raise ErrorSesion("El servidor cerró la conexión")
+            fwd = ForwardMsg()
+            fwd.ParseFromString(crudo)
+            tipo = fwd.WhichOneof("type")
+            if tipo == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                elemento = fwd.delta.new_element
+                tipo_elemento = elemento.WhichOneof("type")
+                if tipo_elemento == "exception":
+                    raise ErrorSesion(elemento.exception.message)
+                # Un st.error (p. ej. "Error al cargar el modelo") también es una sesión fallida
+                if (
+                    tipo_elemento == "alert"
+                    and elemento.alert.format == Alert.ERROR
+                    and not elemento.alert.body.startswith(RESULTADOS_EN_ERROR)
+                ):
+                    raise ErrorSesion(elemento.alert.body)
+                if tipo_elemento in WIDGETS:
+                    self.widgets[getattr(elemento, tipo_elemento).id] = (
+                        tipo_elemento, getattr(elemento, tipo_elemento)
+                    )
+            elif tipo == "script_finished":
+                estado = fwd.script_finished
+                if estado == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise ErrorSesion("Error de compilación del script")
+                if estado != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return
+
+    def _buscar(self, etiqueta=None, opcion=None):
+        for id_widget, (tipo, widget) in self.widgets.items():
+            if etiqueta is not None and widget.label == etiqueta:
+                return id_widget, tipo, widget
+            if opcion is not None and tipo in ("selectbox", "radio") and opcion in widget.options:
+                return id_widget, tipo, widget
+        raise ErrorSesion(f"No se encontró el widget {etiqueta or opcion!r}")
+
+    def opciones(self, etiqueta):
+        return list(self._buscar(etiqueta=etiqueta)[2].options)
+
+    async def elegir(self, opcion):
+        """Elige una opción en el selectbox/radio que la contenga."""
+        id_widget, _, widget = self._buscar(opcion=opcion)
+        self.estados[id_widget] = ("int_value", list(widget.options).index(opcion))
+        await self.rerun()
+
+    async def fijar(self, valores):
+        """Fija varios inputs (numéricos, slider, selectbox, hora, texto) por etiqueta en un solo rerun."""
+        for etiqueta, valor in valores.items():
+            id_widget, tipo, widget = self._buscar(etiqueta=etiqueta)
+            if tipo in ("selectbox", "radio"):
+                self.estados[id_widget] = ("int_value", list(widget.options).index(valor))
+            elif tipo == "number_input":
+                if widget.data_type == NumberInput.INT:
+                    self.estados[id_widget] = ("int_value", int(valor))
+                else:
+                    self.estados[id_widget] = ("double_value", float(valor))
+            elif tipo == "slider":
+                self.estados[id_widget] = ("double_array_value", [float(valor)])
+            else:
+                self.estados[id_widget] = ("string_value", str(valor))
+        await self.rerun()
+
+    async def pulsar(self, etiqueta):
+        id_widget, _, _ = self._buscar(etiqueta=etiqueta)
+        await self.rerun(disparadores=[id_widget])
+
+
+# ==========================
+# ESCENARIOS
+# ==========================
+def entrada_generada(rng):
+    """Entrada aleatoria válida para el modelo (14 variables)."""
+    distancia = rng.uniform(10, 600)
+    tiempo_estimado = distancia / rng.uniform(10, 40) * 60 + 15
+    demora = rng.gauss(0, 60)
+    entrada = {col: rng.choice(opciones) for col, opciones in OPCIONES_ENTRADA.items()}
+    entrada.update({
+        "Distancia_km": round(distancia, 2),
+        "TiempoEstimado_min": round(tiempo_estimado, 1),
+        "TiempoReal_min": round(tiempo_estimado + max(demora, 0), 1),
+        "Demora_min": round(demora, 1),
+        "Peso_kg": rng.randint(100, 20000),
+        "ExperienciaConductor_anios": rng.randint(0, 40),
+        "AntiguedadCamion_anios": rng.randint(0, 30),
+        "NivelCombustible_pct": round(rng.uniform(5, 100), 1),
+    })
+    return entrada
+
+
+async def escenario_inicio(args, rng):
+    async with SesionStreamlit(args.url, args.timeout) as sesion:
+        await sesion.rerun()
+
+
+async def escenario_caso_predefinido(args, rng):
+    async with SesionStreamlit(args.url, args.timeout) as sesion:
+        await sesion.rerun()
+        await sesion.elegir(MODO_CASOS)
+        casos = sesion.opciones("Seleccione un caso")
+        await sesion.elegir(rng.choice(casos))
+        await sesion.pulsar(BOTON_PREDECIR)
+
+
+async def escenario_entrada_generada(args, rng):
+    # Los tiempos y la demora los calcula la app a partir de la ventana de entrega
+    entrada = entrada_generada(rng)
+    inicio_ventana = rng.randint(6, 18)
+    fin_ventana = min(inicio_ventana + rng.randint(2, 6), 23)
+    async with SesionStreamlit(args.url, args.timeout) as sesion:
+        await sesion.rerun()
+        await sesion.fijar({
+            "Clima": entrada["Clima"],
+            "Nivel de Tráfico": entrada["TraficoPico"],
+            "Riesgo de Ruta": entrada["RiesgoRuta"],
+            "Distancia Total (km)": entrada["Distancia_km"],
+            "Tipo de Carga": entrada["TipoCarga"],
+            "Peso de Carga (kg)": entrada["Peso_kg"],
+            "Hora inicio de ventana de entrega": f"{inicio_ventana:02d}:00",
+            "Hora fin de ventana de entrega": f"{fin_ventana:02d}:{rng.choice(['00', '30'])}",
+            "Experiencia del Conductor (años)": entrada["ExperienciaConductor_anios"],
+            "Antigüedad del Vehículo (años)": entrada["AntiguedadCamion_anios"],
+            "Historial de Fallas Mecánicas": entrada["FallasMecanicas"],
+            "Nivel de Combustible Inicial (%)": entrada["NivelCombustible_pct"],
+        })
+        await sesion.pulsar(BOTON_PREDECIR)
+
+
+async def escenario_clustering(args, rng):
+    async with SesionStreamlit(args.url, args.timeout) as sesion:
+        await sesion.rerun()
+        await sesion.elegir(MODULO_CLUSTERING)
+        await sesion.fijar({
+            "Frenadas Duras": rng.randint(0, 50),
+            "Excesos de Velocidad": rng.randint(0, 30),
+            "Horas de Manejo al Mes": rng.randint(80, 220),
+            "Kilómetros al Mes": rng.randint(1000, 8000),
+            "Índice de Fatiga": rng.randint(0, 10),
+        })
+        await sesion.pulsar(BOTON_ANALIZAR)
+
+
+async def escenario_http(args, rng):
+    cuerpo = None
+    if args.http_metodo != "GET":
+        cuerpo = json.dumps(entrada_generada(rng))
+    respuesta = await AsyncHTTPClient().fetch(HTTPRequest(
+        args.http_url or args.url.rstrip("/") + "/_stcore/health",
+        method=args.http_metodo,
+        body=cuerpo,
+        headers={"Content-Type": "application/json"},
+        request_timeout=args.timeout,
+    ), raise_error=False)
+    if respuesta.code >= 400 or respuesta.code == 599:
+        raise ErrorSesion(f"HTTP {respuesta.code}")
+
+
+ESCENARIOS = {
+    "inicio": escenario_inicio,
+    "caso_predefinido": escenario_caso_predefinido,
+    "entrada_generada": escenario_entrada_generada,
+    "clustering": escenario_clustering,
+    "http": escenario_http,
+}
+
+
+# ==========================
+# GENERADOR DE CARGA
+# ==========================
+async def _medir(nombre, args, rng, resultados, semaforo, llegada):
+    # La latencia se mide desde la llegada programada: la espera por el semáforo
+    # (y cualquier atraso del generador) cuenta, para no caer en omisión coordinada
+    async with semaforo:
+        try:
+            await ESCENARIOS[nombre](args, rng)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        resultados[nombre].append((time.perf_counter() - llegada, error))
+
+
+async def _llegadas(nombre, tasa, args, resultados, semaforo, tareas):
+    # Proceso de Poisson: tiempos entre llegadas exponenciales, sobre un
+    # calendario fijo para que las demoras del bucle no corran las llegadas.
+    # Este generador solo sortea llegadas; cada sesión tiene el suyo, así la
+    # misma --semilla reproduce el calendario y las entradas de cada sesión
+    rng = random.Random(f"{args.semilla}-{nombre}")
+    llegada = time.perf_counter()
+    fin = llegada + args.duracion
+    for i in itertools.count():
+        llegada += rng.expovariate(tasa)
+        if llegada >= fin:
+            return
+        await asyncio.sleep(max(0.0, llegada - time.perf_counter()))
+        rng_sesion = random.Random(f"{args.semilla}-{nombre}-{i}")
+        tareas.append(asyncio.ensure_future(_medir(nombre, args, rng_sesion, resultados, semaforo, llegada)))
+
+
+async def ejecutar_carga(args, tasas):
+    resultados = {nombre: [] for nombre in tasas}
+    semaforo = asyncio.Semaphore(args.max_concurrentes)
+    tareas = []
+    inicio = time.perf_counter()
+    await asyncio.gather(*(
+        _llegadas(nombre, tasa, args, resultados, semaforo, tareas) for nombre, tasa in tasas.items()
+    ))
+    await asyncio.gather(*tareas)
+    return resultados, time.perf_counter() - inicio
+
+
+def resumir(resultados, duracion):
+    filas = []
+    for nombre, mediciones in resultados.items():
+        latencias = np.array([t for t, error in mediciones if error is None]) * 1000
+        errores = [error for _, error in mediciones if error is not None]
+        total = len(mediciones)
+        p50, p95, p99 = np.percentile(latencias, [50, 95, 99]) if len(latencias) else (np.nan,) * 3
+        filas.append({
+            "escenario": nombre,
+            "sesiones": total,
+            "ok": len(latencias),
+            "errores_pct": 100 * len(errores) / total if total else 0.0,
+            "por_seg": len(latencias) / duracion,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "ejemplo_error": errores[0] if errores else "",
+        })
+    return filas
+
+
+def imprimir(filas):
+    print(f"{'escenario':<18}{'sesiones':>9}{'ok':>7}{'error %':>9}{'ok/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for f in filas:
+        print(
+            f"{f['escenario']:<18}{f['sesiones']:>9}{f['ok']:>7}{f['errores_pct']:>9.1f}{f['por_seg']:>8.2f}"
+            f"{f['p50_ms']:>10.0f}{f['p95_ms']:>10.0f}{f['p99_ms']:>10.0f}"
+        )
+    for f in filas:
+        if f["ejemplo_error"]:
+            print(f"  {f['escenario']}: {f['ejemplo_error']}")
+
+
+def iniciar_app(puerto):
+    """Levanta la app localmente y espera a que responda el health check."""
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", "streamlit_app.py",
+         "--server.headless=true", f"--server.port={puerto}"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://localhost:{puerto}"
+
+    async def esperar():
+        cliente = AsyncHTTPClient()
+        for _ in range(120):
+            try:
+                await cliente.fetch(url + "/_stcore/health", request_timeout=1)
+                return
+            except Exception:
+                await asyncio.sleep(0.5)
+        raise RuntimeError("La app no respondió al health check")
+
+    try:
+        asyncio.run(esperar())
+    except Exception:
+        proceso.terminate()
+        raise
+    return proceso, url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la app de entregas")
+    parser.add_argument("--url", default="http://localhost:8501", help="URL de la app de Streamlit")
+    parser.add_argument(
+        "--escenario", action="append", default=[],
+        help=f"nombre:tasa (sesiones nuevas por segundo). Escenarios: {', '.join(ESCENARIOS)}"
+    )
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos generando llegadas")
+    parser.add_argument("--max-concurrentes", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--http-url", help="Endpoint del escenario http (por defecto, el health check de la app)")
+    parser.add_argument("--http-metodo", default="GET", choices=["GET", "POST"])
+    parser.add_argument("--iniciar", action="store_true", help="Levantar la app localmente para la prueba")
+    parser.add_argument("--puerto", type=int, default=8599)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--json", help="Guardar el resumen en este archivo")
+    args = parser.parse_args()
+
+    tasas = {}
+    for escenario in args.escenario or ["caso_predefinido:1"]:
+        nombre, _, tasa = escenario.partition(":")
+        if nombre not in ESCENARIOS:
+            parser.error(f"Escenario desconocido: {nombre}")
+        tasas[nombre] = float(tasa or 1)
+
+    proceso = None
+    if args.iniciar:
+        proceso, args.url = iniciar_app(args.puerto)
+    try:
+        resultados, duracion = asyncio.run(ejecutar_carga(args, tasas))
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+
+    filas = resumir(resultados, duracion)
+    imprimir(filas)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(filas, f, indent=2, default=float)
+
+
+if __name__ == "__main__":
+    main()
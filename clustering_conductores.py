@@ -0,0 +1,484 @@
+# clustering_conductores.py
+# Análisis de conductores: PCA por bloques (riesgo, experticia, seguridad),
+# K-Means sobre riesgo y experticia, y PCA 2D global para visualización.
+#
+# Para flotas grandes hay un modo por bloques que no carga todo en memoria:
+#   python clustering_conductores.py registros_conductor_mes.parquet
+# y deja el modelo en artefactos/modelo_flota.joblib.
+import argparse
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler
+
+from esquema import VALIDADOR_CONDUCTOR, RechazosLote
+
+COLS_RIESGO = ["frenadas_duras", "excesos_velocidad", "incidentes_carga", "infracciones"]
+COLS_EXPERIENCIA = ["horas_manejo_mes", "km_mes", "entregas_mes"]
+COLS_SEGURIDAD = ["reclamos_clientes", "accidentes_leves", "asistencia_capacitaciones", "indice_fatiga"]
+
+COLUMNAS_CONDUCTOR = [
+    "frenadas_duras",
+    "excesos_velocidad",
+    "incidentes_carga",
+    "infracciones",
+    "horas_manejo_mes",
+    "km_mes",
+    "entregas_mes",
+    "reclamos_clientes",
+    "accidentes_leves",
+    "asistencia_capacitaciones",
+    "indice_fatiga",
+]
+
+N_CLUSTERS = 4
+
+RUTA_MODELO_FLOTA = Path("artefactos/modelo_flota.joblib")
+
+# Bloques de PCA del modo por bloques: columnas, signo de cada columna y componentes.
+# En seguridad las capacitaciones restan, igual que en analizar_conductor.
+BLOQUES_PCA = {
+    "riesgo": (COLS_RIESGO, [1, 1, 1, 1], 1),
+    "experiencia": (COLS_EXPERIENCIA, [1, 1, 1], 1),
+    "seguridad": (COLS_SEGURIDAD, [1, 1, -1, 1], 1),
+    "global": (COLUMNAS_CONDUCTOR, [1] * len(COLUMNAS_CONDUCTOR), 2),
+}
+
+
+@lru_cache(maxsize=4)
+def generar_flota_simulada(n_conductores=200, semilla=42):
+    """Conductores sintéticos de referencia (misma secuencia que np.random.seed(42))."""
+    rng = np.random.RandomState(semilla)
+    return pd.DataFrame({
+        "frenadas_duras": rng.poisson(8, n_conductores),
+        "excesos_velocidad": rng.poisson(4, n_conductores),
+        "incidentes_carga": rng.poisson(2, n_conductores),
+        "infracciones": rng.poisson(1, n_conductores),
+        "horas_manejo_mes": rng.normal(160, 30, n_conductores).clip(80, 220),
+        "km_mes": rng.normal(4500, 1000, n_conductores).clip(1000, 8000),
+        "entregas_mes": rng.normal(120, 40, n_conductores).clip(30, 300),
+        "reclamos_clientes": rng.poisson(3, n_conductores),
+        "accidentes_leves": rng.poisson(1, n_conductores),
+        "asistencia_capacitaciones": rng.normal(6, 2, n_conductores).clip(0, 12),
+        "indice_fatiga": rng.normal(5, 2, n_conductores).clip(0, 10)
+    })
+
+
+def escalar_0_100(valor, todos):
+    vmin = todos.min()
+    vmax = todos.max()
+    if vmax == vmin:
+        return 50.0
+    return 100 * (valor - vmin) / (vmax - vmin)
+
+
+def nivel_de_riesgo(score):
+    if score < 33:
+        return "Bajo"
+    elif score < 66:
+        return "Medio"
+    return "Alto"
+
+
+def nivel_de_experticia(score):
+    if score < 33:
+        return "Junior"
+    elif score < 66:
+        return "Intermedio"
+    return "Senior"
+
+
+def nivel_de_seguridad(score):
+    if score < 33:
+        return "Buena seguridad / baja fatiga"
+    elif score < 66:
+        return "Vigilancia necesaria"
+    return "Crítico (alto riesgo / fatiga)"
+
+
+def nombrar_clusters(centroides, mediana_riesgo, mediana_exp):
+    """Nombre de cada cluster según el cuadrante de su centroide (riesgo, experticia)."""
+    nombres_clusters = {}
+    for i, centroide in enumerate(centroides):
+        riesgo_centroide = centroide[0]
+        exp_centroide = centroide[1]
+
+        if riesgo_centroide < mediana_riesgo and exp_centroide > mediana_exp:
+            nombres_clusters[i] = "🟢 MAESTRO_IDEAL"
+        elif riesgo_centroide < mediana_riesgo and exp_centroide < mediana_exp:
+            nombres_clusters[i] = "🟡 NOVATO_SEGURO"
+        elif riesgo_centroide > mediana_riesgo and exp_centroide > mediana_exp:
+            nombres_clusters[i] = "🟠 EXPERTO_RIESGOSO"
+        else:
+            nombres_clusters[i] = "🔴 NOVATO_RIESGOSO"
+    return nombres_clusters
+
+
+def _pc1_orientado(datos):
+    # Los loadings indican cómo cada variable contribuye al componente;
+    # si la mayoría son negativos, invertimos la dirección
+    pca = PCA(n_components=1)
+    pc1 = pca.fit_transform(StandardScaler().fit_transform(datos)).flatten()
+    if np.mean(pca.components_[0]) < 0:
+        pc1 = -pc1
+    return pc1, pca.components_[0]
+
+
+def analizar_conductor(datos_conductor):
+    """Ubica a un conductor (dict con COLUMNAS_CONDUCTOR) frente a la flota de referencia."""
+    datos_simulados = generar_flota_simulada()
+    n_conductores = len(datos_simulados)
+    fila = pd.DataFrame([{col: datos_conductor[col] for col in COLUMNAS_CONDUCTOR}])
+    datos_completos = pd.concat([datos_simulados, fila], ignore_index=True)
+
+    # ================================
+    # PCA POR BLOQUES (3 SCORES)
+    # ================================
+    riesgo_pc1, loadings_riesgo = _pc1_orientado(datos_completos[COLS_RIESGO])
+    score_riesgo = escalar_0_100(riesgo_pc1[-1], riesgo_pc1)
+
+    # Más horas/km/entregas = más experticia
+    exp_pc1, loadings_exp = _pc1_orientado(datos_completos[COLS_EXPERIENCIA])
+    score_exp = escalar_0_100(exp_pc1[-1], exp_pc1)
+
+    # Seguridad / Fatiga: las capacitaciones restan
+    seg_df = datos_completos[COLS_SEGURIDAD].copy()
+    seg_df["asistencia_capacitaciones"] = -seg_df["asistencia_capacitaciones"]
+    scaler_seg = StandardScaler()
+    pca_seg = PCA(n_components=1)
+    seg_pc1 = pca_seg.fit_transform(scaler_seg.fit_transform(seg_df)).flatten()
+    score_seg = escalar_0_100(seg_pc1[-1], seg_pc1)
+
+    # ================================
+    # CLUSTERING BASADO EN RIESGO Y EXPERTICIA
+    # ================================
+    features_clustering = np.column_stack([riesgo_pc1, exp_pc1])
+    kmeans = KMeans(n_clusters=N_CLUSTERS, random_state=42, n_init=10)
+    clusters = kmeans.fit_predict(features_clustering)
+    cluster_conductor = clusters[-1]
+    nombres_clusters = nombrar_clusters(
+        kmeans.cluster_centers_, np.median(riesgo_pc1), np.median(exp_pc1)
+    )
+
+    # ================================
+    # PCA 2D GLOBAL PARA VISUALIZACIÓN
+    # ================================
+    datos_normalizados_global = StandardScaler().fit_transform(datos_completos)
+    datos_pca_global = PCA(n_components=2).fit_transform(datos_normalizados_global)
+    df_viz = pd.DataFrame({
+        "PC1": datos_pca_global[:, 0],
+        "PC2": datos_pca_global[:, 1],
+        "Cluster": clusters,
+        "Tipo": ["Otros Conductores"] * n_conductores + ["Conductor Actual"]
+    })
+
+    mask_cluster = clusters[:-1] == cluster_conductor
+    promedios_cluster = datos_simulados[mask_cluster].mean() if mask_cluster.sum() > 0 else None
+
+    return {
+        "score_riesgo": float(score_riesgo),
+        "nivel_riesgo": nivel_de_riesgo(score_riesgo),
+        "score_exp": float(score_exp),
+        "nivel_exp": nivel_de_experticia(score_exp),
+        "score_seg": float(score_seg),
+        "nivel_seg": nivel_de_seguridad(score_seg),
+        "cluster": nombres_clusters[cluster_conductor],
+        "cluster_id": int(cluster_conductor),
+        "loadings_riesgo": dict(zip(COLS_RIESGO, loadings_riesgo)),
+        "loadings_exp": dict(zip(COLS_EXPERIENCIA, loadings_exp)),
+        "promedios_cluster": promedios_cluster,
+        "df_viz": df_viz,
+        "referencia": f"flota simulada de {n_conductores} conductores",
+    }
+
+
+# ================================
+# MODO POR BLOQUES (FLOTAS GRANDES)
+# ================================
+def leer_registros(ruta, tam_bloque=500_000):
+    """Itera bloques de registros conductor-mes de un CSV, un Parquet o una carpeta de Parquet."""
+    ruta = Path(ruta)
+    if ruta.is_dir():
+        for archivo in sorted(ruta.glob("*.parquet")):
+            yield from leer_registros(archivo, tam_bloque)
+    elif ruta.suffix == ".parquet":
+        archivo = pq.ParquetFile(ruta, memory_map=True)
+        for lote in archivo.iter_batches(batch_size=tam_bloque, columns=COLUMNAS_CONDUCTOR):
+            yield lote.to_pandas()
+    else:
+        yield from pd.read_csv(ruta, usecols=COLUMNAS_CONDUCTOR, chunksize=tam_bloque)
+
+
+def _momentos(bloque):
+    # n, media y suma de productos centrados de un bloque (se combinan sin perder precisión)
+    X = bloque[COLUMNAS_CONDUCTOR].to_numpy(dtype=float)
+    media = X.mean(axis=0)
+    centrado = X - media
+    return len(X), media, centrado.T @ centrado
+
+
+def _combinar_momentos(a, b):
+    # Fórmula de Chan et al. para combinar medias y covarianzas parciales
+    n_a, media_a, m2_a = a
+    n_b, media_b, m2_b = b
+    n = n_a + n_b
+    delta = media_b - media_a
+    media = media_a + delta * n_b / n
+    m2 = m2_a + m2_b + np.outer(delta, delta) * n_a * n_b / n
+    return n, media, m2
+
+
+def _muestra_minima(muestra, nuevos, tam_muestra, rng):
+    # Muestra aleatoria uniforme de tamaño acotado: se conservan las filas con menor clave aleatoria
+    claves = rng.random(len(nuevos))
+    if muestra is not None:
+        nuevos = np.vstack([muestra[1], nuevos])
+        claves = np.concatenate([muestra[0], claves])
+    if len(claves) > tam_muestra:
+        idx = np.argpartition(claves, tam_muestra)[:tam_muestra]
+        claves, nuevos = claves[idx], nuevos[idx]
+    return claves, nuevos
+
+
+class ModeloFlota:
+    """Scores y clusters de conductores ajustados por bloques sobre toda la flota.
+
+    Los PCA salen de la covarianza exacta acumulada bloque a bloque (equivalen
+    a StandardScaler + PCA sobre todos los datos) y los clusters de
+    MiniBatchKMeans. Los nombres siguen la misma regla de cuadrantes que
+    analizar_conductor.
+    """
+
+    def __init__(self, n, media, m2):
+        self.n_registros = n
+        self.media = media
+        varianza = m2 / n
+        self.escala = np.sqrt(np.diag(varianza))
+        self.escala[self.escala == 0] = 1.0
+        correlacion = varianza / np.outer(self.escala, self.escala)
+
+        self.componentes = {}
+        for nombre, (cols, signos, n_comp) in BLOQUES_PCA.items():
+            idx = [COLUMNAS_CONDUCTOR.index(c) for c in cols]
+            signos = np.asarray(signos, dtype=float)
+            sub = correlacion[np.ix_(idx, idx)] * np.outer(signos, signos)
+            valores, vectores = np.linalg.eigh(sub)
+            vt = vectores[:, np.argsort(valores)[::-1][:n_comp]].T
+            # Misma convención de signo que sklearn (svd_flip sobre los loadings)
+            maximos = np.argmax(np.abs(vt), axis=1)
+            vt *= np.sign(vt[np.arange(n_comp), maximos])[:, None]
+            self.componentes[nombre] = (idx, signos, vt)
+
+        # Riesgo y experticia se orientan como en analizar_conductor
+        self.orientacion = {
+            nombre: -1.0 if np.mean(self.componentes[nombre][2][0]) < 0 else 1.0
+            for nombre in ("riesgo", "experiencia")
+        }
+        self.orientacion["seguridad"] = 1.0
+
+    def proyectar(self, bloque, nombre):
+        idx, signos, vt = self.componentes[nombre]
+        X = bloque[COLUMNAS_CONDUCTOR].to_numpy(dtype=float)
+        Z = (X - self.media) / self.escala
+        pcs = (Z[:, idx] * signos) @ vt.T
+        if nombre in self.orientacion:
+            return pcs[:, 0] * self.orientacion[nombre]
+        return pcs
+
+    def loadings(self, nombre):
+        idx, _, vt = self.componentes[nombre]
+        return dict(zip([COLUMNAS_CONDUCTOR[i] for i in idx], vt[0]))
+
+    def _scores(self, pc, nombre):
+        vmin, vmax = self.rangos[nombre]
+        if vmax == vmin:
+            return np.full(len(pc), 50.0)
+        return np.clip(100 * (pc - vmin) / (vmax - vmin), 0, 100)
+
+    def puntuar(self, registros):
+        """Scores 0-100, niveles y cluster de cada fila (vectorizado)."""
+        riesgo = self.proyectar(registros, "riesgo")
+        exp = self.proyectar(registros, "experiencia")
+        seg = self.proyectar(registros, "seguridad")
+        clusters = self.kmeans.predict(np.column_stack([riesgo, exp]))
+
+        score_riesgo = self._scores(riesgo, "riesgo")
+        score_exp = self._scores(exp, "experiencia")
+        score_seg = self._scores(seg, "seguridad")
+        return pd.DataFrame({
+            "score_riesgo": score_riesgo,
+            "nivel_riesgo": np.select([score_riesgo < 33, score_riesgo < 66], ["Bajo", "Medio"], "Alto"),
+            "score_exp": score_exp,
+            "nivel_exp": np.select([score_exp < 33, score_exp < 66], ["Junior", "Intermedio"], "Senior"),
+            "score_seg": score_seg,
+            "nivel_seg": np.select(
+                [score_seg < 33, score_seg < 66],
+                ["Buena seguridad / baja fatiga", "Vigilancia necesaria"],
+                "Crítico (alto riesgo / fatiga)"
+            ),
+            "cluster_id": clusters,
+            "cluster": np.array([self.nombres_clusters[i] for i in range(N_CLUSTERS)])[clusters],
+        }, index=registros.index)
+
+    def analizar_conductor(self, datos_conductor):
+        """Mismo resultado que analizar_conductor(), pero frente a la flota ajustada."""
+        fila = pd.DataFrame([{col: datos_conductor[col] for col in COLUMNAS_CONDUCTOR}])
+        puntaje = self.puntuar(fila).iloc[0]
+        cluster_id = int(puntaje["cluster_id"])
+        promedios_cluster = None
+        if self.conteo_clusters[cluster_id] > 0:
+            promedios_cluster = pd.Series(
+                self.suma_clusters[cluster_id] / self.conteo_clusters[cluster_id],
+                index=COLUMNAS_CONDUCTOR
+            )
+
+        global_fila = self.proyectar(fila, "global")
+        df_viz = pd.DataFrame({
+            "PC1": np.append(self.muestra_viz[:, 0], global_fila[0, 0]),
+            "PC2": np.append(self.muestra_viz[:, 1], global_fila[0, 1]),
+            "Cluster": np.append(self.muestra_viz[:, 2].astype(int), cluster_id),
+            "Tipo": ["Otros Conductores"] * len(self.muestra_viz) + ["Conductor Actual"]
+        })
+
+        return {
+            "score_riesgo": float(puntaje["score_riesgo"]),
+            "nivel_riesgo": puntaje["nivel_riesgo"],
+            "score_exp": float(puntaje["score_exp"]),
+            "nivel_exp": puntaje["nivel_exp"],
+            "score_seg": float(puntaje["score_seg"]),
+            "nivel_seg": puntaje["nivel_seg"],
+            "cluster": puntaje["cluster"],
+            "cluster_id": cluster_id,
+            "loadings_riesgo": self.loadings("riesgo"),
+            "loadings_exp": self.loadings("experiencia"),
+            "promedios_cluster": promedios_cluster,
+            "df_viz": df_viz,
+            "referencia": f"flota completa ({self.n_registros:,} registros conductor-mes)",
+        }
+
+
+def cargar_modelo_flota(ruta=RUTA_MODELO_FLOTA):
+    """Modelo de flota ajustado por bloques, o None si todavía no existe."""
+    ruta = Path(ruta)
+    return joblib.load(ruta) if ruta.exists() else None
+
+
+def ajustar_flota_por_bloques(bloques, n_jobs=-1, tam_muestra=100_000, semilla=42, rechazos=None):
+    """Ajusta un ModeloFlota en cuatro pasadas con memoria acotada.
+
+    bloques: función sin argumentos que devuelve un iterador nuevo de
+    DataFrames con COLUMNAS_CONDUCTOR (p. ej. lambda: leer_registros(ruta)).
+    Solo se usan las filas que cumplen ESQUEMA_CONDUCTOR; las rechazadas se
+    cuentan en rechazos (RechazosLote), si se pasa.
+    """
+    rng = np.random.default_rng(semilla)
+    paralelo = Parallel(n_jobs=n_jobs, prefer="threads", return_as="generator_unordered")
+
+    def validos(rechazos=None):
+        return VALIDADOR_CONDUCTOR.filtrar(bloques(), rechazos, extras=False)
+
+    # Pasada 1: medias y covarianzas de todos los bloques PCA a la vez, en paralelo
+    # (los rechazos se cuentan solo en esta pasada)
+    momentos = None
+    for parcial in paralelo(delayed(_momentos)(b) for b in validos(rechazos)):
+        momentos = parcial if momentos is None else _combinar_momentos(momentos, parcial)
+    if momentos is None:
+        raise ValueError("No hay registros para ajustar el modelo de flota")
+    modelo = ModeloFlota(*momentos)
+
+    # Pasada 2: rangos de los scores y muestra acotada de (riesgo, experticia)
+    rangos = {nombre: [np.inf, -np.inf] for nombre in ("riesgo", "experiencia", "seguridad")}
+    muestra = None
+    for bloque in validos():
+        pcs = {nombre: modelo.proyectar(bloque, nombre) for nombre in rangos}
+        for nombre, pc in pcs.items():
+            rangos[nombre] = [min(rangos[nombre][0], pc.min()), max(rangos[nombre][1], pc.max())]
+        muestra = _muestra_minima(
+            muestra, np.column_stack([pcs["riesgo"], pcs["experiencia"]]), tam_muestra, rng
+        )
+    modelo.rangos = {nombre: tuple(r) for nombre, r in rangos.items()}
+
+    # Pasada 3: K-Means por mini-lotes sobre toda la flota, partiendo del K-Means de la muestra
+    inicial = KMeans(n_clusters=N_CLUSTERS, random_state=semilla, n_init=10).fit(muestra[1])
+    kmeans = MiniBatchKMeans(
+        n_clusters=N_CLUSTERS, init=inicial.cluster_centers_, n_init=1, random_state=semilla
+    )
+    pendiente = None
+    for bloque in validos():
+        features = np.column_stack([
+            modelo.proyectar(bloque, "riesgo"), modelo.proyectar(bloque, "experiencia")
+        ])
+        # partial_fit necesita al menos N_CLUSTERS filas; los bloques chicos se acumulan
+        if pendiente is not None:
+            features = np.vstack([pendiente, features])
+        if len(features) < N_CLUSTERS * 10:
+            pendiente = features
+            continue
+        pendiente = None
+        kmeans.partial_fit(features)
+    if pendiente is not None:
+        kmeans.partial_fit(pendiente)
+
+    # labels_ del último mini-lote no sirve para puntuar y solo agranda el artefacto
+    del kmeans.labels_
+    modelo.kmeans = kmeans
+    medianas = np.median(muestra[1], axis=0)
+    modelo.nombres_clusters = nombrar_clusters(kmeans.cluster_centers_, medianas[0], medianas[1])
+
+    # Pasada 4: promedios por cluster y muestra del PCA global para visualización
+    def _resumen_clusters(bloque):
+        clusters = kmeans.predict(np.column_stack([
+            modelo.proyectar(bloque, "riesgo"), modelo.proyectar(bloque, "experiencia")
+        ]))
+        X = bloque[COLUMNAS_CONDUCTOR].to_numpy(dtype=float)
+        suma = np.zeros((N_CLUSTERS, len(COLUMNAS_CONDUCTOR)))
+        np.add.at(suma, clusters, X)
+        viz = np.column_stack([modelo.proyectar(bloque, "global"), clusters])
+        return np.bincount(clusters, minlength=N_CLUSTERS), suma, viz
+
+    modelo.conteo_clusters = np.zeros(N_CLUSTERS, dtype=np.int64)
+    modelo.suma_clusters = np.zeros((N_CLUSTERS, len(COLUMNAS_CONDUCTOR)))
+    muestra_viz = None
+    for conteo, suma, viz in paralelo(delayed(_resumen_clusters)(b) for b in validos()):
+        modelo.conteo_clusters += conteo
+        modelo.suma_clusters += suma
+        muestra_viz = _muestra_minima(muestra_viz, viz, 2_000, rng)
+    modelo.muestra_viz = muestra_viz[1]
+
+    return modelo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajuste por bloques del modelo de flota")
+    parser.add_argument("registros", help="CSV, Parquet o carpeta de Parquet con registros conductor-mes")
+    parser.add_argument("--salida", default=str(RUTA_MODELO_FLOTA))
+    parser.add_argument("--tam-bloque", type=int, default=500_000)
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    # Ejecutado como script, ModeloFlota se serializaría como __main__.ModeloFlota y
+    # la app y los demás módulos no podrían cargarlo; se usa la clase del módulo importado
+    from clustering_conductores import ajustar_flota_por_bloques
+
+    rechazos = RechazosLote(VALIDADOR_CONDUCTOR)
+    modelo = ajustar_flota_por_bloques(
+        lambda: leer_registros(args.registros, args.tam_bloque), n_jobs=args.n_jobs, rechazos=rechazos
+    )
+    joblib.dump(modelo, args.salida)
+    print(f"Modelo de flota ajustado con {modelo.n_registros:,} registros -> {args.salida}")
+    for cluster_id, nombre in modelo.nombres_clusters.items():
+        print(f"  {nombre}: {modelo.conteo_clusters[cluster_id]:,} registros")
+    if rechazos.filas:
+        print(rechazos.informe())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# esquema.py
+# Esquema declarativo de las entradas: las 14 variables del modelo de entregas
+# y las 11 métricas del conductor. Cada esquema se compila una vez a arreglos
+# NumPy (límites, tablas de normalización de categorías) y valida/coerce lotes
+# completos de una pasada, con una máscara de errores por fila y campo.
+#
+# Uso:
+#   resultado = VALIDADOR_ENVIO.validar(envios)
+#   pipe.predict_proba(resultado.filas_validas())
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# tipo: "categoria" (valores permitidos), "float" o "entero"; min/max opcionales
+ESQUEMA_ENVIO = {
+    "Clima": {"tipo": "categoria", "valores": ["Bueno", "Lluvia", "Tormenta"]},
+    "TraficoPico": {"tipo": "categoria", "valores": ["Bajo", "Medio", "Alto"]},
+    "RiesgoRuta": {"tipo": "categoria", "valores": ["Bajo", "Medio", "Alto"]},
+    "Distancia_km": {"tipo": "float", "min": 0.0, "max": 1000.0},
+    "TiempoEstimado_min": {"tipo": "float", "min": 0.0},
+    "TiempoReal_min": {"tipo": "float", "min": 0.0},
+    "Demora_min": {"tipo": "float"},
+    "TipoCarga": {"tipo": "categoria", "valores": ["Normal", "Fragil", "Peligrosa"]},
+    "Peso_kg": {"tipo": "float", "min": 0, "max": 20000},
+    "ExperienciaConductor_anios": {"tipo": "entero", "min": 0, "max": 40},
+    "AntiguedadCamion_anios": {"tipo": "entero", "min": 0, "max": 30},
+    "FallasMecanicas": {"tipo": "categoria", "valores": ["No", "Si"]},
+    "NivelCombustible_pct": {"tipo": "float", "min": 0.0, "max": 100.0},
+    "HorarioSalida": {"tipo": "categoria", "valores": ["Manana", "Tarde", "Noche"]},
+}
+
+# Rangos de validez de los datos (telemetría, registros conductor-mes); los
+# topes de los widgets del formulario son otra cosa y viven en la app
+ESQUEMA_CONDUCTOR = {
+    "frenadas_duras": {"tipo": "entero", "min": 0},
+    "excesos_velocidad": {"tipo": "entero", "min": 0},
+    "incidentes_carga": {"tipo": "entero", "min": 0},
+    "infracciones": {"tipo": "entero", "min": 0},
+    "horas_manejo_mes": {"tipo": "float", "min": 0, "max": 744},  # horas de un mes de 31 días
+    "km_mes": {"tipo": "float", "min": 0},
+    "entregas_mes": {"tipo": "float", "min": 0},
+    "reclamos_clientes": {"tipo": "entero", "min": 0},
+    "accidentes_leves": {"tipo": "entero", "min": 0},
+    "asistencia_capacitaciones": {"tipo": "float", "min": 0},
+    "indice_fatiga": {"tipo": "float", "min": 0, "max": 10},
+}
+
+
+def normalizar_texto(valor):
+    """'  Mañana ' -> 'manana', 'Sí' -> 'si', 'FRÁGIL' -> 'fragil'."""
+    texto = unicodedata.normalize("NFKD", str(valor).strip().lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+class ResultadoValidacion:
+    """Datos coercionados y máscara de errores (filas x campos) de un lote."""
+
+    def __init__(self, datos, errores, campos, enteros, originales):
+        self.datos = datos
+        self.errores = errores
+        self.campos = campos
+        self.enteros = enteros
+        self.validas = ~errores.any(axis=1)
+        self._originales = originales
+
+    @property
+    def n_invalidas(self):
+        return int((~self.validas).sum())
+
+    def filas_validas(self, extras=False):
+        """Filas sin errores; con extras=True se agregan las columnas ajenas al esquema (id_envio, fecha...)."""
+        datos = self.datos
+        if extras:
+            propias = set(self.campos)
+            otras = [c for c in self._originales.columns if c not in propias]
+            datos = pd.concat([datos, self._originales[otras]], axis=1)
+        # En las filas válidas los campos enteros ya son enteros exactos
+        return datos[self.validas].astype({c: np.int64 for c in self.enteros})
+
+    def resumen(self):
+        """Filas con error por campo, solo los campos con algún error."""
+        conteos = pd.Series(self.errores.sum(axis=0), index=self.campos, name="filas_con_error")
+        return conteos[conteos > 0]
+
+    def mensajes(self, fila=0):
+        """Errores legibles de una fila (posición en el lote)."""
+        salida = []
+        for j in np.flatnonzero(self.errores[fila]):
+            campo = self.campos[j]
+            if campo not in self._originales:
+                salida.append(f"{campo}: falta la columna")
+            else:
+                valor = self._originales[campo].iloc[fila]
+                valor = valor.item() if isinstance(valor, np.generic) else valor
+                salida.append(f"{campo}: valor inválido {valor!r}")
+        return salida
+
+
+class ValidadorEsquema:
+    """Esquema compilado: una tabla de normalización por categoría y los
+    límites numéricos como vectores, para chequear todas las columnas
+    numéricas con una sola operación sobre la matriz del lote."""
+
+    def __init__(self, esquema):
+        self.esquema = esquema
+        self.campos = list(esquema)
+        self.categoricas = [c for c in self.campos if esquema[c]["tipo"] == "categoria"]
+        self.numericas = [c for c in self.campos if esquema[c]["tipo"] != "categoria"]
+
+        self._normalizacion = {
+            c: {normalizar_texto(v): v for v in esquema[c]["valores"]} for c in self.categoricas
+        }
+        self._min = np.array([esquema[c].get("min", -np.inf) for c in self.numericas], dtype=float)
+        self._max = np.array([esquema[c].get("max", np.inf) for c in self.numericas], dtype=float)
+        self.enteros = [c for c in self.numericas if esquema[c]["tipo"] == "entero"]
+        self._entero = np.isin(self.numericas, self.enteros)
+        self._pos = {c: j for j, c in enumerate(self.campos)}
+
+    def _coercer_categoria(self, campo, columna):
+        # Se normalizan solo los valores distintos; el lote se resuelve con sus códigos
+        codigos, unicos = pd.factorize(columna, use_na_sentinel=True)
+        tabla = self._normalizacion[campo]
+        canonicos = np.array([tabla.get(normalizar_texto(u)) for u in unicos] + [None], dtype=object)
+        invalidos = np.array([c is None for c in canonicos])
+        # El código -1 (nulo) toma el último elemento: None, inválido
+        return canonicos[codigos], invalidos[codigos]
+
+    def validar(self, datos):
+        """Valida y coerce un DataFrame (o un dict / lista de dicts) sin detenerse en la primera fila mala."""
+        if isinstance(datos, dict):
+            datos = pd.DataFrame([datos])
+        elif not isinstance(datos, pd.DataFrame):
+            datos = pd.DataFrame(list(datos))
+        n = len(datos)
+        errores = np.zeros((n, len(self.campos)), dtype=bool)
+        columnas = {}
+
+        for campo in self.categoricas:
+            if campo not in datos:
+                columnas[campo] = np.full(n, None, dtype=object)
+                errores[:, self._pos[campo]] = True
+                continue
+            columnas[campo], invalidos = self._coercer_categoria(campo, datos[campo])
+            errores[:, self._pos[campo]] = invalidos
+
+        if self.numericas:
+            matriz = np.full((n, len(self.numericas)), np.nan)
+            for j, campo in enumerate(self.numericas):
+                if campo in datos:
+                    matriz[:, j] = pd.to_numeric(datos[campo], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+            with np.errstate(invalid="ignore"):
+                invalidos = (
+                    ~np.isfinite(matriz)
+                    | (matriz < self._min)
+                    | (matriz > self._max)
+                    | (self._entero & (matriz != np.round(matriz)))
+                )
+            errores[:, [self._pos[c] for c in self.numericas]] = invalidos
+            for j, campo in enumerate(self.numericas):
+                columnas[campo] = matriz[:, j]
+
+        coercionados = pd.DataFrame({c: columnas[c] for c in self.campos}, index=datos.index)
+        return ResultadoValidacion(coercionados, errores, self.campos, self.enteros, datos)
+
+    def filtrar(self, bloques, rechazos=None, extras=True):
+        """Valida un iterable de bloques y entrega solo las filas válidas de cada uno."""
+        for bloque in bloques:
+            validacion = self.validar(bloque)
+            if rechazos is not None:
+                rechazos.sumar(validacion)
+            validos = validacion.filas_validas(extras=extras)
+            if len(validos):
+                yield validos
+
+
+class RechazosLote:
+    """Filas rechazadas por el esquema, acumuladas a lo largo de los bloques de un lote."""
+
+    def __init__(self, validador):
+        self.filas = 0
+        self.por_campo = pd.Series(0, index=validador.campos, dtype=np.int64)
+
+    def sumar(self, validacion):
+        self.filas += validacion.n_invalidas
+        self.por_campo = self.por_campo.add(validacion.resumen(), fill_value=0).astype(np.int64)
+
+    def informe(self):
+        """Texto para la consola; vacío si no hubo rechazos."""
+        if not self.filas:
+            return ""
+        return (
+            f"{self.filas:,} filas rechazadas por el esquema; filas con error por columna:\n"
+            + self.por_campo[self.por_campo > 0].to_string()
+        )
+
+
+VALIDADOR_ENVIO = ValidadorEsquema(ESQUEMA_ENVIO)
+VALIDADOR_CONDUCTOR = ValidadorEsquema(ESQUEMA_CONDUCTOR)
@@ -0,0 +1,194 @@
+# explicabilidad.py
+# Atribución de variables por predicción para el MLP de entregas.
+#
+# Se usa Gradientes Integrados calculados analíticamente: el preprocesamiento
+# (StandardScaler + OneHotEncoder) es lineal, así que basta con propagar el
+# gradiente a mano por las capas del MLP. Todos los puntos del camino se
+# evalúan en una sola pasada matricial.
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+# Derivada de cada activación de sklearn expresada en función de la salida
+DERIVADAS_ACTIVACION = {
+    "relu": lambda h: (h > 0).astype(h.dtype),
+    "tanh": lambda h: 1.0 - h ** 2,
+    "logistic": lambda h: h * (1.0 - h),
+    "identity": lambda h: np.ones_like(h),
+}
+
+ACTIVACIONES = {
+    "relu": lambda z: np.maximum(z, 0),
+    "tanh": np.tanh,
+    "logistic": lambda z: 1.0 / (1.0 + np.exp(-z)),
+    "identity": lambda z: z,
+}
+
+
+class ExplicadorMLP:
+    """Explica P(llegar tarde) de un Pipeline(preprocess, model=MLPClassifier).
+
+    Las contribuciones están en puntos de probabilidad y suman
+    P(entrada) - P(referencia). La referencia es el "envío promedio":
+    variables numéricas en su media de entrenamiento y categóricas
+    repartidas uniformemente entre sus categorías.
+    """
+
+    def __init__(self, pipe, pasos=128, max_cache=512):
+        self.preprocess = pipe[:-1]
+        self.mlp = pipe[-1]
+        if self.mlp.activation not in DERIVADAS_ACTIVACION:
+            raise ValueError(f"Activación no soportada: {self.mlp.activation}")
+        if len(self.mlp.classes_) != 2:
+            raise ValueError("El explicador solo soporta clasificación binaria")
+
+        self.pasos = pasos
+        self.max_cache = max_cache
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        # La clase 1 es "a tiempo"; explicamos la probabilidad de la clase 0 (tarde)
+        self.columnas = list(self.preprocess.feature_names_in_)
+        self.grupos, self.referencia = self._grupos_y_referencia()
+        # Matriz (columnas transformadas x variables originales) para agregar
+        self.agregacion = (
+            self.grupos[:, None] == np.array(self.columnas, dtype=object)[None, :]
+        ).astype(float)
+        self.alphas = (np.arange(pasos) + 0.5) / pasos
+        self.pasos_transformacion = self._compilar_transformacion()
+
+    def _grupos_y_referencia(self):
+        # Mapear cada columna transformada a su variable original
+        ct = self.preprocess[-1]
+        n_salida = sum(
+            s.stop - s.start for s in ct.output_indices_.values()
+        )
+        grupos = np.empty(n_salida, dtype=object)
+        referencia = np.zeros(n_salida)
+
+        for nombre, transformador, cols in ct.transformers_:
+            if transformador == "drop" or nombre == "remainder":
+                continue
+            indices = ct.output_indices_[nombre]
+            if hasattr(transformador, "categories_"):
+                inicio = indices.start
+                for col, categorias in zip(cols, transformador.categories_):
+                    k = len(categorias)
+                    grupos[inicio:inicio + k] = col
+                    referencia[inicio:inicio + k] = 1.0 / k
+                    inicio += k
+            else:
+                grupos[indices] = list(cols)
+
+        return grupos, referencia
+
+    def _compilar_transformacion(self):
+        # El ColumnTransformer de sklearn tarda varios ms por fila; como solo
+        # escala y codifica, lo reproducimos con NumPy. Si el pipeline cambia
+        # a algo que no reconocemos, se usa transform() tal cual.
+        if len(self.preprocess) != 1:
+            return None
+        pasos = []
+        for nombre, transformador, cols in self.preprocess[-1].transformers_:
+            if transformador == "drop":
+                continue
+            if isinstance(transformador, OneHotEncoder) and transformador.drop_idx_ is None:
+                pasos.append(("cat", list(cols), transformador.categories_))
+            elif isinstance(transformador, StandardScaler):
+                media = transformador.mean_ if transformador.mean_ is not None else 0.0
+                escala = transformador.scale_ if transformador.scale_ is not None else 1.0
+                pasos.append(("num", list(cols), (media, escala)))
+            else:
+                return None
+        return pasos
+
+    def _prob_tarde_y_gradiente(self, X):
+        # Pasada hacia adelante guardando las activaciones ocultas
+        activacion = ACTIVACIONES[self.mlp.activation]
+        derivada = DERIVADAS_ACTIVACION[self.mlp.activation]
+        capas = list(zip(self.mlp.coefs_, self.mlp.intercepts_))
+
+        h = X
+        ocultas = []
+        for W, b in capas[:-1]:
+            h = activacion(h @ W + b)
+            ocultas.append(h)
+        W_out, b_out = capas[-1]
+        logit = (h @ W_out + b_out)[:, 0]
+
+        # P(tarde) = 1 - sigmoid(logit) = sigmoid(-logit)
+        prob_tarde = 1.0 / (1.0 + np.exp(logit))
+
+        # Retropropagación analítica hasta la entrada transformada
+        g = (-prob_tarde * (1.0 - prob_tarde))[:, None] @ W_out.T
+        for (W, _), h in zip(reversed(capas[:-1]), reversed(ocultas)):
+            g = (g * derivada(h)) @ W.T
+
+        return prob_tarde, g
+
+    def _transformar(self, entradas):
+        if self.pasos_transformacion is not None:
+            bloques = []
+            for tipo, cols, parametros in self.pasos_transformacion:
+                if tipo == "num":
+                    media, escala = parametros
+                    bloques.append((entradas[cols].to_numpy(dtype=float) - media) / escala)
+                else:
+                    for col, categorias in zip(cols, parametros):
+                        valores = entradas[col].to_numpy()
+                        bloques.append((valores[:, None] == categorias[None, :]).astype(float))
+            return np.hstack(bloques)
+
+        X = self.preprocess.transform(entradas[self.columnas])
+        if hasattr(X, "toarray"):
+            X = X.toarray()
+        return np.asarray(X, dtype=float)
+
+    def _integrar(self, X, indice):
+        n, d = X.shape
+        m = self.pasos
+
+        # Todos los puntos del camino referencia -> entrada en una sola matriz
+        delta = X - self.referencia
+        camino = self.referencia + self.alphas[None, :, None] * delta[:, None, :]
+        _, g = self._prob_tarde_y_gradiente(camino.reshape(n * m, d))
+        ig = delta * g.reshape(n, m, d).mean(axis=1)
+
+        # Sumar las columnas one-hot de cada variable categórica
+        return pd.DataFrame(ig @ self.agregacion, columns=self.columnas, index=indice)
+
+    def explicar_lote(self, entradas):
+        """Devuelve un DataFrame (filas x variables originales) de contribuciones."""
+        return self._integrar(self._transformar(entradas), entradas.index)
+
+    def explicar(self, entrada):
+        """Explica una sola fila. Resultado cacheado por valores de entrada."""
+        fila = entrada[self.columnas].iloc[[0]]
+        clave = tuple(fila.iloc[0].tolist())
+        # La caché se comparte entre sesiones (st.cache_resource): se accede con el lock
+        with self._lock:
+            if clave in self._cache:
+                self._cache.move_to_end(clave)
+                return self._cache[clave]
+
+        X = self._transformar(fila)
+        prob_tarde, _ = self._prob_tarde_y_gradiente(
+            np.vstack([X, self.referencia[None, :]])
+        )
+        contribuciones = self._integrar(X, fila.index).iloc[0]
+        orden = contribuciones.abs().sort_values(ascending=False).index
+
+        resultado = {
+            "prob_tarde": float(prob_tarde[0]),
+            "prob_referencia": float(prob_tarde[1]),
+            "contribuciones": contribuciones[orden],
+        }
+
+        with self._lock:
+            self._cache[clave] = resultado
+            if len(self._cache) > self.max_cache:
+                self._cache.popitem(last=False)
+        return resultado
@@ -0,0 +1,213 @@
+# exportacion.py
+# Resultados de puntuación por lote y segmentación de flota como tablas Arrow
+# y archivos Parquet con tipos correctos: categorías como diccionarios,
+# probabilidades en float32 y particiones por fecha o cluster_id.
+#
+# Uso:
+#   python exportacion.py predicciones envios.parquet --salida resultados/predicciones --particion fecha
+#   python exportacion.py segmentacion registros.csv --salida resultados/segmentos --particion cluster_id
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from clustering_conductores import COLUMNAS_CONDUCTOR, RUTA_MODELO_FLOTA, cargar_modelo_flota
+from esquema import ESQUEMA_ENVIO, VALIDADOR_CONDUCTOR, VALIDADOR_ENVIO, RechazosLote
+from servicio_modelos import ServidorModelos
+
+ETIQUETAS_PREDICCION = ["A tiempo", "Tarde"]
+NIVELES = {
+    "nivel_riesgo": ["Bajo", "Medio", "Alto"],
+    "nivel_exp": ["Junior", "Intermedio", "Senior"],
+    "nivel_seg": ["Buena seguridad / baja fatiga", "Vigilancia necesaria", "Crítico (alto riesgo / fatiga)"],
+}
+NOMBRES_CLUSTERS = ["🟢 MAESTRO_IDEAL", "🟡 NOVATO_SEGURO", "🟠 EXPERTO_RIESGOSO", "🔴 NOVATO_RIESGOSO"]
+
+
+def columna_diccionario(valores, categorias):
+    """Arreglo Arrow dictionary<int8, string>; los valores fuera de categorias quedan nulos."""
+    diccionario = pa.array(categorias, type=pa.string())
+    indices = pc.index_in(pa.array(valores, type=pa.string()), value_set=diccionario)
+    return pa.DictionaryArray.from_arrays(indices.cast(pa.int8()), diccionario)
+
+
+def columna_float32(valores):
+    return pa.array(np.asarray(valores, dtype=np.float32))
+
+
+def columna_entera(valores, campo=None):
+    """Entero más chico que cubre el rango del campo en ESQUEMA_ENVIO (int64 si no tiene rango).
+
+    El tipo sale del esquema y no de los datos, así todos los bloques de un
+    dataset tienen el mismo tipo.
+    """
+    rango = ESQUEMA_ENVIO.get(campo, {})
+    tipo = np.int64
+    if "min" in rango and "max" in rango:
+        for candidato in (np.int8, np.int16, np.int32):
+            if np.iinfo(candidato).min <= rango["min"] and rango["max"] <= np.iinfo(candidato).max:
+                tipo = candidato
+                break
+    return pa.array(np.asarray(valores, dtype=tipo))
+
+
+def categorias_modelo(pipe):
+    """Categorías de cada variable categórica, tomadas del OneHotEncoder del pipeline."""
+    categorias = {}
+    for _, transformador, cols in pipe[:-1][-1].transformers_:
+        if hasattr(transformador, "categories_"):
+            for col, cats in zip(cols, transformador.categories_):
+                categorias[col] = [str(c) for c in cats]
+    return categorias
+
+
+def tabla_predicciones(entradas, prob_tarde, categorias, umbral=0.5, modelo=None, fecha=None, calibracion=None):
+    """Tabla Arrow con las entradas del modelo, la probabilidad de retraso y la predicción.
+
+    Con la calibración publicada del modelo se agregan la probabilidad calibrada
+    y la banda de riesgo, y la predicción usa el umbral calibrado.
+    """
+    columnas = {}
+    if "id_envio" in entradas:
+        columnas["id_envio"] = pa.array(entradas["id_envio"].astype(str).to_numpy(), type=pa.string())
+    if fecha is not None or "fecha" in entradas:
+        fechas = entradas["fecha"] if "fecha" in entradas else pd.Series(fecha, index=entradas.index)
+        dias = pd.to_datetime(fechas).to_numpy().astype("datetime64[D]")
+        columnas["fecha"] = pa.array(dias, type=pa.date32())
+
+    for col in entradas.columns:
+        if col in categorias:
+            columnas[col] = columna_diccionario(entradas[col].to_numpy(dtype=object), categorias[col])
+        elif col not in columnas and pd.api.types.is_integer_dtype(entradas[col]):
+            columnas[col] = columna_entera(entradas[col].to_numpy(), col)
+        elif col not in columnas and pd.api.types.is_numeric_dtype(entradas[col]):
+            columnas[col] = columna_float32(entradas[col].to_numpy())
+
+    prob_tarde = np.asarray(prob_tarde, dtype=np.float32)
+    columnas["prob_tarde"] = pa.array(prob_tarde)
+    prob_decision = prob_tarde
+    if calibracion is not None:
+        prob_decision = calibracion.calibrar(prob_tarde)
+        umbral = calibracion.umbral
+        columnas["prob_tarde_calibrada"] = columna_float32(prob_decision)
+        columnas["banda_riesgo"] = pa.DictionaryArray.from_arrays(
+            pa.array(calibracion.codigos_banda(prob_decision).astype(np.int8)),
+            pa.array(calibracion.etiquetas.tolist(), type=pa.string())
+        )
+    columnas["prediccion"] = pa.DictionaryArray.from_arrays(
+        pa.array((prob_decision >= umbral).astype(np.int8)), pa.array(ETIQUETAS_PREDICCION)
+    )
+    if modelo is not None:
+        columnas["modelo"] = pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(len(prob_tarde), dtype=np.int8)), pa.array([modelo])
+        )
+    return pa.table(columnas)
+
+
+def tabla_segmentacion(registros, puntajes):
+    """Tabla Arrow con los scores y el cluster de cada registro conductor-mes."""
+    columnas = {}
+    for col in ("conductor", "mes"):
+        if col in registros:
+            columnas[col] = pa.array(registros[col].astype(str).to_numpy(), type=pa.string())
+    for col in ("score_riesgo", "score_exp", "score_seg"):
+        columnas[col] = columna_float32(puntajes[col].to_numpy())
+    for col, categorias in NIVELES.items():
+        columnas[col] = columna_diccionario(puntajes[col].to_numpy(), categorias)
+    columnas["cluster_id"] = pa.array(puntajes["cluster_id"].to_numpy(dtype=np.int8))
+    columnas["cluster"] = columna_diccionario(puntajes["cluster"].to_numpy(dtype=object), NOMBRES_CLUSTERS)
+    return pa.table(columnas)
+
+
+def buffer_parquet(tabla, compresion="zstd"):
+    """Parquet en memoria como pa.Buffer.
+
+    memoryview(buffer) lo expone sin copiar (para una respuesta HTTP);
+    st.download_button exige bytes, así que ahí se hace una única copia.
+    """
+    salida = pa.BufferOutputStream()
+    pq.write_table(tabla, salida, compression=compresion)
+    return salida.getvalue()
+
+
+def escribir_parquet(tablas, destino, particion=None, compresion="zstd"):
+    """Escribe una tabla o un iterable de tablas como dataset Parquet, particionado en estilo hive."""
+    if isinstance(tablas, pa.Table):
+        tablas = [tablas]
+    tablas = iter(tablas)
+    primera = next(tablas, None)
+    if primera is None:
+        return
+
+    def lotes():
+        for tabla in (primera, *tablas):
+            yield from tabla.to_batches()
+
+    ds.write_dataset(
+        lotes(),
+        destino,
+        schema=primera.schema,
+        format="parquet",
+        partitioning=particion,
+        partitioning_flavor="hive" if particion else None,
+        existing_data_behavior="overwrite_or_ignore",
+        file_options=ds.ParquetFileFormat().make_write_options(compression=compresion),
+    )
+
+
+def leer_bloques(ruta, tam_bloque=1_000_000):
+    ruta = Path(ruta)
+    if ruta.suffix == ".parquet":
+        for lote in pq.ParquetFile(ruta, memory_map=True).iter_batches(batch_size=tam_bloque):
+            yield lote.to_pandas()
+    else:
+        yield from pd.read_csv(ruta, chunksize=tam_bloque)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar resultados por lote a Parquet")
+    parser.add_argument("tipo", choices=["predicciones", "segmentacion"])
+    parser.add_argument("entrada", help="CSV o Parquet con envíos (14 variables) o registros conductor-mes")
+    parser.add_argument("--salida", required=True, help="Carpeta del dataset Parquet")
+    parser.add_argument("--particion", nargs="*", default=None, help="Columnas de partición (p. ej. fecha, cluster_id)")
+    parser.add_argument("--fecha", help="Fecha de las predicciones si la entrada no trae columna fecha")
+    parser.add_argument("--tam-bloque", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    if args.tipo == "predicciones":
+        servidor = ServidorModelos("artefactos")
+        pipe = servidor.modelos[servidor.primario]
+        categorias = categorias_modelo(pipe)
+        calibracion = servidor.calibraciones.get(servidor.primario)
+        columnas = list(pipe.feature_names_in_)
+        rechazos = RechazosLote(VALIDADOR_ENVIO)
+
+        def tablas():
+            for validos in VALIDADOR_ENVIO.filtrar(leer_bloques(args.entrada, args.tam_bloque), rechazos):
+                prob_tarde = pipe.predict_proba(validos[columnas])[:, 0]
+                yield tabla_predicciones(
+                    validos, prob_tarde, categorias, modelo=servidor.primario, fecha=args.fecha,
+                    calibracion=calibracion
+                )
+    else:
+        modelo_flota = cargar_modelo_flota()
+        if modelo_flota is None:
+            parser.error(f"No existe {RUTA_MODELO_FLOTA}; ajústelo con clustering_conductores.py")
+        rechazos = RechazosLote(VALIDADOR_CONDUCTOR)
+
+        def tablas():
+            for validos in VALIDADOR_CONDUCTOR.filtrar(leer_bloques(args.entrada, args.tam_bloque), rechazos):
+                yield tabla_segmentacion(validos, modelo_flota.puntuar(validos[COLUMNAS_CONDUCTOR]))
+
+    escribir_parquet(tablas(), args.salida, particion=args.particion)
+    print(f"Resultados escritos en {args.salida}")
+    if rechazos.filas:
+        print(rechazos.informe())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# historial_scores.py
+# Historial de scores por conductor y mes: scores de riesgo, experticia y
+# seguridad, niveles y cluster, en un dataset Parquet de solo anexado
+# particionado por mes (artefactos/historial_scores/mes=AAAA-MM/).
+#
+# Cada escritura agrega archivos nuevos, ordenados por conductor para que
+# las consultas de un conductor salten los row groups que no lo contienen.
+# Si un (conductor, mes) se puntúa de nuevo, vale la escritura más reciente.
+#
+# Uso:
+#   python historial_scores.py registrar registros_conductor_mes.parquet
+#   python historial_scores.py conductor C045
+#   python historial_scores.py transiciones 2026-09 2026-10
+#   python historial_scores.py compactar 2026-10
+import argparse
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from clustering_conductores import COLUMNAS_CONDUCTOR, RUTA_MODELO_FLOTA, cargar_modelo_flota
+from esquema import VALIDADOR_CONDUCTOR, RechazosLote
+from exportacion import NOMBRES_CLUSTERS, leer_bloques, tabla_segmentacion
+
+DIRECTORIO_HISTORIAL = Path("artefactos/historial_scores")
+# Row groups chicos: sus estadísticas min/max de conductor permiten saltarlos
+FILAS_POR_GRUPO = 2048
+PARTICION = ds.partitioning(pa.schema([("mes", pa.string())]), flavor="hive")
+COLUMNAS_SCORES = ["score_riesgo", "score_exp", "score_seg"]
+
+
+def normalizar_meses(valores):
+    """Claves "AAAA-MM" de una columna de meses (texto, fechas o timestamps); None si no se entiende."""
+    fechas = pd.to_datetime(pd.Series(valores).astype(str), format="ISO8601", errors="coerce")
+    meses = pd.PeriodIndex(fechas, freq="M").astype(str).to_numpy(dtype=object)
+    meses[fechas.isna().to_numpy()] = None
+    return meses
+
+
+def mes_relativo(mes, meses):
+    """'2026-10', -23 -> '2024-12'."""
+    return str(pd.Period(mes, "M") + meses)
+
+
+def _ultima_escritura(df):
+    # Solo anexado: ante duplicados de (conductor, mes) gana la escritura más reciente
+    df = df.sort_values("escrito", kind="stable")
+    return df.drop_duplicates(["conductor", "mes"], keep="last")
+
+
+class HistorialScores:
+    """Scores mensuales por conductor, consultables por conductor y por mes."""
+
+    def __init__(self, directorio=DIRECTORIO_HISTORIAL):
+        self.directorio = Path(directorio)
+        self._cache = (None, None)
+
+    def existe(self):
+        return any(self.directorio.glob("mes=*/*.parquet"))
+
+    def meses(self):
+        return sorted(p.name.split("=", 1)[1] for p in self.directorio.glob("mes=*") if any(p.iterdir()))
+
+    def firma(self):
+        return tuple(
+            (str(p.relative_to(self.directorio)), p.stat().st_mtime)
+            for p in sorted(self.directorio.glob("mes=*/*.parquet"))
+        )
+
+    def _dataset(self):
+        # Se reutiliza mientras no cambien los archivos: evita volver a listar
+        # carpetas y leer los metadatos de cada Parquet en cada consulta
+        firma = self.firma()
+        if self._cache[0] != firma:
+            self._cache = (firma, ds.dataset(self.directorio, format="parquet", partitioning=PARTICION))
+        return self._cache[1]
+
+    def agregar(self, tabla):
+        """Anexa una tabla de tabla_segmentacion() con columnas conductor y mes.
+
+        El mes se normaliza a "AAAA-MM" para que todo escritor use la misma
+        clave de partición; devuelve cuántas filas se descartaron por mes ilegible.
+        """
+        meses = normalizar_meses(tabla["mes"].to_pylist())
+        validos = np.array([m is not None for m in meses], dtype=bool)
+        tabla = tabla.filter(pa.array(validos)).set_column(
+            tabla.schema.get_field_index("mes"), "mes", pa.array(meses[validos].tolist(), type=pa.string())
+        )
+        if tabla.num_rows == 0:
+            return int((~validos).sum())
+        escrito = pa.array(np.full(tabla.num_rows, int(time.time() * 1000)), type=pa.timestamp("ms"))
+        tabla = tabla.append_column("escrito", escrito).sort_by([("mes", "ascending"), ("conductor", "ascending")])
+        ds.write_dataset(
+            tabla,
+            self.directorio,
+            format="parquet",
+            partitioning=PARTICION,
+            basename_template=f"parte-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            min_rows_per_group=min(FILAS_POR_GRUPO, tabla.num_rows),
+            max_rows_per_group=FILAS_POR_GRUPO,
+        )
+        return int((~validos).sum())
+
+    def conductor(self, conductor, desde=None, hasta=None):
+        """Historia de un conductor entre dos meses (inclusive), ordenada por mes."""
+        filtro = ds.field("conductor") == str(conductor)
+        if desde is not None:
+            filtro &= ds.field("mes") >= str(pd.Period(desde, "M"))
+        if hasta is not None:
+            filtro &= ds.field("mes") <= str(pd.Period(hasta, "M"))
+        df = self._dataset().to_table(filter=filtro).to_pandas()
+        return _ultima_escritura(df).sort_values("mes").reset_index(drop=True)
+
+    def ultimos_meses(self, conductor, n=24, hasta=None):
+        meses = self.meses()
+        if not meses:
+            return self.conductor(conductor)
+        hasta = hasta or meses[-1]
+        return self.conductor(conductor, desde=mes_relativo(hasta, -(n - 1)), hasta=hasta)
+
+    def clusters_del_mes(self, mes):
+        """Código de cluster (posición en NOMBRES_CLUSTERS) de cada conductor en el mes."""
+        mes = str(pd.Period(mes, "M"))
+        tabla = self._dataset().to_table(
+            columns=["conductor", "mes", "cluster", "escrito"], filter=ds.field("mes") == mes
+        )
+        # Se traducen los índices del diccionario de cada archivo, sin materializar los nombres
+        codigos = [np.empty(0, dtype=np.int64)]
+        for bloque in tabla["cluster"].chunks:
+            mapa = np.array([NOMBRES_CLUSTERS.index(v) for v in bloque.dictionary.to_pylist()], dtype=np.int64)
+            codigos.append(mapa[bloque.indices.to_numpy(zero_copy_only=False)])
+        codigos = np.concatenate(codigos)
+        df = pd.DataFrame({
+            "conductor": tabla["conductor"].to_numpy(),
+            "mes": mes,
+            "codigo": codigos,
+            "escrito": tabla["escrito"].to_numpy(),
+        })
+        return _ultima_escritura(df)[["conductor", "codigo"]]
+
+    def matriz_transiciones(self, mes_origen, mes_destino):
+        """Conductores que pasaron de cada cluster (filas) a cada cluster (columnas)."""
+        pares = self.clusters_del_mes(mes_origen).merge(
+            self.clusters_del_mes(mes_destino), on="conductor", suffixes=("_origen", "_destino")
+        )
+        k = len(NOMBRES_CLUSTERS)
+        conteos = np.bincount(
+            pares["codigo_origen"].to_numpy() * k + pares["codigo_destino"].to_numpy(), minlength=k * k
+        )
+        return pd.DataFrame(conteos.reshape(k, k), index=NOMBRES_CLUSTERS, columns=NOMBRES_CLUSTERS)
+
+    def resumen_mensual(self):
+        """Por mes y cluster: conductores y scores promedio de toda la flota (última escritura)."""
+        tabla = self._dataset().to_table(columns=["conductor", "mes", "cluster", "escrito"] + COLUMNAS_SCORES)
+        df = _ultima_escritura(tabla.to_pandas())
+        resumen = df.groupby(["mes", "cluster"], observed=True).agg(
+            conductores=("conductor", "size"), **{f"{c}_mean": (c, "mean") for c in COLUMNAS_SCORES}
+        )
+        return resumen.reset_index().sort_values(["mes", "cluster"]).reset_index(drop=True)
+
+    def compactar(self, mes):
+        """Reescribe un mes en un solo archivo, sin duplicados y ordenado por conductor."""
+        carpeta = self.directorio / f"mes={mes}"
+        anteriores = sorted(carpeta.glob("*.parquet"))
+        if len(anteriores) <= 1:
+            return
+        tabla = pq.read_table(anteriores, partitioning=None)
+        # Índices de la última escritura de cada conductor
+        orden = pc.sort_indices(tabla, [("conductor", "ascending"), ("escrito", "descending")])
+        tabla = tabla.take(orden)
+        conductores = tabla["conductor"].to_numpy(zero_copy_only=False)
+        primera = np.r_[True, conductores[1:] != conductores[:-1]]
+        tabla = tabla.filter(pa.array(primera))
+        # El punto inicial oculta el archivo a los lectores hasta que está completo
+        nombre = f"compacto-{uuid.uuid4().hex[:8]}.parquet"
+        pq.write_table(tabla, carpeta / f".{nombre}", row_group_size=FILAS_POR_GRUPO)
+        (carpeta / f".{nombre}").rename(carpeta / nombre)
+        for ruta in anteriores:
+            ruta.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas sobre el historial de scores de conductores")
+    parser.add_argument("--directorio", default=str(DIRECTORIO_HISTORIAL))
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_registrar = sub.add_parser("registrar", help="Puntuar registros conductor-mes y anexarlos al historial")
+    p_registrar.add_argument("entrada", help="CSV o Parquet con conductor, mes y las 11 métricas")
+    p_registrar.add_argument("--tam-bloque", type=int, default=1_000_000)
+    p_conductor = sub.add_parser("conductor", help="Evolución de un conductor")
+    p_conductor.add_argument("id")
+    p_conductor.add_argument("--meses", type=int, default=24)
+    p_transiciones = sub.add_parser("transiciones", help="Matriz de cambios de cluster entre dos meses")
+    p_transiciones.add_argument("mes_origen")
+    p_transiciones.add_argument("mes_destino")
+    sub.add_parser("resumen", help="Conductores y scores promedio por mes y cluster")
+    p_compactar = sub.add_parser("compactar", help="Unir los archivos de un mes")
+    p_compactar.add_argument("mes")
+    args = parser.parse_args()
+
+    historial = HistorialScores(args.directorio)
+    pd.set_option("display.width", 160)
+    if args.comando == "registrar":
+        # Misma puntuación que la exportación de segmentación, con el modelo de flota
+        modelo_flota = cargar_modelo_flota()
+        if modelo_flota is None:
+            parser.error(f"No existe {RUTA_MODELO_FLOTA}; ajústelo con clustering_conductores.py")
+        filas = 0
+        meses_ilegibles = 0
+        rechazos = RechazosLote(VALIDADOR_CONDUCTOR)
+        for validos in VALIDADOR_CONDUCTOR.filtrar(leer_bloques(args.entrada, args.tam_bloque), rechazos):
+            if "conductor" not in validos or "mes" not in validos:
+                parser.error("La entrada necesita columnas conductor y mes")
+            descartadas = historial.agregar(
+                tabla_segmentacion(validos, modelo_flota.puntuar(validos[COLUMNAS_CONDUCTOR]))
+            )
+            filas += len(validos) - descartadas
+            meses_ilegibles += descartadas
+        print(f"{filas:,} registros anexados a {historial.directorio}")
+        if meses_ilegibles:
+            print(f"{meses_ilegibles:,} filas descartadas por mes ilegible (se espera AAAA-MM o una fecha)")
+        if rechazos.filas:
+            print(rechazos.informe())
+    elif args.comando == "conductor":
+        columnas = ["mes"] + COLUMNAS_SCORES + ["cluster"]
+        print(historial.ultimos_meses(args.id, args.meses)[columnas].to_string(index=False))
+    elif args.comando == "transiciones":
+        print(historial.matriz_transiciones(args.mes_origen, args.mes_destino).to_string())
+    elif args.comando == "resumen":
+        print(historial.resumen_mensual().to_string(index=False))
+    else:
+        historial.compactar(args.mes)
+        print(f"Mes {args.mes} compactado")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# prediccion.py
+# Armado de la entrada del modelo de entregas a partir de los datos del
+# formulario, y biblioteca de casos predefinidos (casos_predefinidos.json).
+#
+# Los casos son datos: operaciones puede agregar o editar casos en el JSON
+# sin tocar el código. Las horas se escriben como "HH:MM"; hora_salida fija
+# la hora de despacho del caso para que su resultado sea reproducible.
+import hashlib
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+RUTA_CASOS = Path("casos_predefinidos.json")
+CAMPOS_HORA = ("hora_inicio_entrega", "hora_fin_entrega")
+
+VELOCIDAD_BASE = 40
+factores_clima = {"Bueno": 1.0, "Lluvia": 0.8, "Tormenta": 0.5}
+factores_trafico = {"Bajo": 1.0, "Medio": 0.75, "Alto": 0.5}
+
+
+def calcular_tiempo_estimado(distancia, clima, trafico, experiencia, antiguedad):
+    velocidad_efectiva = VELOCIDAD_BASE * factores_clima[clima] * factores_trafico[trafico]
+
+    if experiencia < 2:
+        velocidad_efectiva *= 0.7
+    elif experiencia < 5:
+        velocidad_efectiva *= 0.85
+    else:
+        velocidad_efectiva *= 1.0
+
+    if antiguedad > 10:
+        velocidad_efectiva *= 0.85
+    elif antiguedad > 5:
+        velocidad_efectiva *= 0.9
+
+    tiempo_viaje_horas = distancia / velocidad_efectiva
+    tiempo_minutos = tiempo_viaje_horas * 60
+    tiempo_parada = 15
+
+    return tiempo_minutos + tiempo_parada
+
+
+def determinar_horario_salida(hora_actual):
+    hora = hora_actual.hour
+
+    if 6 <= hora < 12:
+        return "Manana"
+    elif 12 <= hora < 18:
+        return "Tarde"
+    else:
+        return "Noche"
+
+
+def construir_entrada(datos, hora_actual):
+    """Tiempos derivados y fila del modelo para los datos del formulario y una hora de salida."""
+    horario = determinar_horario_salida(hora_actual)
+    tiempo_estimado = calcular_tiempo_estimado(
+        datos["distancia_km"], datos["clima"], datos["trafico"],
+        datos["experiencia"], datos["antiguedad_camion"]
+    )
+
+    hora_llegada_estimada = hora_actual + timedelta(minutes=tiempo_estimado)
+    hora_inicio_ventana = datetime.combine(hora_actual.date(), datos["hora_inicio_entrega"])
+
+    demora_minutos = (hora_llegada_estimada - hora_inicio_ventana).total_seconds() / 60
+    tiempo_real_simulado = tiempo_estimado + (demora_minutos if demora_minutos > 0 else 0)
+
+    entrada = pd.DataFrame([{
+        "Clima": datos["clima"],
+        "TraficoPico": datos["trafico"],
+        "RiesgoRuta": datos["riesgo_ruta"],
+        "Distancia_km": datos["distancia_km"],
+        "TiempoEstimado_min": tiempo_estimado,
+        "TiempoReal_min": tiempo_real_simulado,
+        "Demora_min": demora_minutos,
+        "TipoCarga": datos["tipo_carga"],
+        "Peso_kg": datos["peso_kg"],
+        "ExperienciaConductor_anios": datos["experiencia"],
+        "AntiguedadCamion_anios": datos["antiguedad_camion"],
+        "FallasMecanicas": datos["fallas_mecanicas"],
+        "NivelCombustible_pct": datos["nivel_combustible"],
+        "HorarioSalida": horario,
+    }])
+    return {
+        "horario": horario,
+        "tiempo_estimado": tiempo_estimado,
+        "hora_llegada_estimada": hora_llegada_estimada,
+        "demora_minutos": demora_minutos,
+        "entrada": entrada,
+    }
+
+
+def _hora(texto):
+    return datetime.strptime(texto, "%H:%M").time()
+
+
+def cargar_casos(ruta=RUTA_CASOS):
+    """Casos predefinidos con las horas ya convertidas a datetime.time."""
+    casos = json.loads(Path(ruta).read_text(encoding="utf-8"))
+    for caso in casos.values():
+        caso["huella"] = huella_caso(caso)
+        caso["hora_salida"] = _hora(caso["hora_salida"])
+        for campo in CAMPOS_HORA:
+            caso["datos"][campo] = _hora(caso["datos"][campo])
+    return casos
+
+
+def huella_caso(caso):
+    """Hash de lo que determina la predicción del caso (datos + hora de salida), antes de convertir horas."""
+    clave = json.dumps([caso["datos"], caso["hora_salida"]], sort_keys=True, default=str)
+    return hashlib.sha1(clave.encode("utf-8")).hexdigest()[:12]
+
+
+def hora_salida_caso(caso, fecha=None):
+    """Salida del caso como datetime; la fecha no cambia el resultado."""
+    return datetime.combine(fecha or datetime.now().date(), caso["hora_salida"])
@@ -0,0 +1,262 @@
+# publicar.py
+# Paso de publicación: precalcula lo que no depende de cada solicitud para
+# cada versión de modelo y lo guarda junto al artefacto, en
+# artefactos/versiones/<version>.json:
+# - las salidas de los casos predefinidos (probabilidad y atribución);
+# - con --holdout, la calibración de la probabilidad de retraso (isotónica o
+#   Platt), el umbral de decisión óptimo y los cortes de las bandas de riesgo.
+#
+# El holdout es un CSV o Parquet con las 14 variables y EntregaATiempo
+# ("Si"/"No" o 1/0), como el dataset de entrenamiento, con envíos que el modelo no vio.
+# Una parte (FRACCION_EVALUACION) se reserva: la calibración, el umbral y los
+# cortes se ajustan con el resto y las métricas publicadas se miden en ella.
+#
+# Correr después de copiar un modelo nuevo a artefactos/ o de editar
+# casos_predefinidos.json:
+#   python publicar.py --holdout datos/holdout_entregas.csv
+import argparse
+import hashlib
+import json
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LogisticRegression
+
+from esquema import VALIDADOR_ENVIO
+from explicabilidad import ExplicadorMLP
+from prediccion import RUTA_CASOS, cargar_casos, construir_entrada, hora_salida_caso
+from servicio_modelos import ServidorModelos, ruta_publicacion
+
+COLUMNA_OBJETIVO = "EntregaATiempo"
+ETIQUETAS_BANDAS = ["Bajo", "Medio", "Alto", "Muy alto / crítico"]
+# Proporción acumulada de envíos del holdout en las bandas hasta cada corte
+CUANTILES_BANDAS = [0.50, 0.80, 0.95]
+# Parte del holdout reservada para medir las métricas publicadas
+FRACCION_EVALUACION = 0.3
+
+
+def precalcular_casos(pipe, casos):
+    """Salida del modelo y atribución de cada caso predefinido."""
+    explicador = ExplicadorMLP(pipe)
+    salidas = {}
+    for nombre, caso in casos.items():
+        calculo = construir_entrada(caso["datos"], hora_salida_caso(caso))
+        validacion = VALIDADOR_ENVIO.validar(calculo["entrada"])
+        if validacion.n_invalidas:
+            raise ValueError(f"{nombre}: " + "; ".join(validacion.mensajes(0)))
+        entrada = validacion.filas_validas()
+        explicacion = explicador.explicar(entrada)
+        salidas[nombre] = {
+            "huella": caso["huella"],
+            "prob_tarde": float(pipe.predict_proba(entrada)[0, 0]),
+            "prob_referencia": explicacion["prob_referencia"],
+            "contribuciones": {k: float(v) for k, v in explicacion["contribuciones"].items()},
+        }
+    return salidas
+
+
+def leer_holdout(ruta):
+    """Envíos válidos del holdout y si cada uno llegó tarde."""
+    ruta = Path(ruta)
+    holdout = pd.read_parquet(ruta) if ruta.suffix == ".parquet" else pd.read_csv(ruta)
+    objetivo = holdout[COLUMNA_OBJETIVO].astype(str).str.strip().str.lower()
+    conocido = objetivo.isin(["si", "sí", "1", "no", "0"]).to_numpy()
+    tarde = objetivo.isin(["no", "0"]).to_numpy()
+    validacion = VALIDADOR_ENVIO.validar(holdout)
+    usar = conocido[validacion.validas]
+    return validacion.filas_validas()[usar], tarde[validacion.validas][usar]
+
+
+def ajustar_curva(prob, y_tarde, metodo="isotonica"):
+    """Curva prob. del modelo -> prob. observada de retraso, como puntos para np.interp."""
+    if metodo == "isotonica":
+        iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds="clip").fit(prob, y_tarde)
+        x, y = iso.X_thresholds_, iso.y_thresholds_
+    else:
+        # Platt: regresión logística sobre el logit; se muestrea en una grilla
+        # densa en logit para que np.interp la reproduzca también cerca de 0 y 1
+        def logit(p):
+            p = np.clip(p, 1e-6, 1 - 1e-6)
+            return np.log(p / (1 - p))
+
+        platt = LogisticRegression(C=1e6).fit(logit(prob)[:, None], y_tarde)
+        x = np.concatenate([[0.0], 1 / (1 + np.exp(-np.linspace(-14, 14, 281))), [1.0]])
+        y = platt.predict_proba(logit(x)[:, None])[:, 1]
+    return np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+
+
+def umbral_optimo(prob_calibrada, y_tarde):
+    """Umbral que maximiza F1 para "tarde", evaluando todos los cortes de una vez."""
+    orden = np.argsort(-prob_calibrada, kind="stable")
+    p, y = prob_calibrada[orden], y_tarde[orden]
+    verdaderos = np.cumsum(y)
+    predichos = np.arange(1, len(y) + 1)
+    # Solo cuentan los cortes entre valores distintos (empates van juntos)
+    ultimo = np.r_[p[1:] != p[:-1], True]
+    precision = verdaderos[ultimo] / predichos[ultimo]
+    recall = verdaderos[ultimo] / max(y.sum(), 1)
+    f1 = np.where(precision + recall > 0, 2 * precision * recall / np.maximum(precision + recall, 1e-12), 0)
+    mejor = int(np.argmax(f1))
+    return float(p[ultimo][mejor]), {
+        "f1": float(f1[mejor]),
+        "precision": float(precision[mejor]),
+        "recall": float(recall[mejor]),
+    }
+
+
+def metricas_decision(prob_calibrada, y_tarde, umbral):
+    """Precisión, recall y F1 de "tarde" al decidir con prob_calibrada >= umbral."""
+    predicho = prob_calibrada >= umbral
+    verdaderos = int((predicho & y_tarde).sum())
+    precision = verdaderos / max(int(predicho.sum()), 1)
+    recall = verdaderos / max(int(y_tarde.sum()), 1)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    return {"f1": f1, "precision": precision, "recall": recall}
+
+
+def cortes_bandas(prob_calibrada):
+    """Cortes por cuantiles de las bandas y etiquetas de las bandas resultantes.
+
+    Una red saturada y la calibración isotónica dejan pocos valores distintos,
+    así que dos cuantiles pueden caer en el mismo escalón y dejar una banda
+    vacía. Ese corte se corre al siguiente valor calibrado; si no hay, la
+    banda se une con la anterior. Devuelve también los avisos de esos ajustes.
+    """
+    valores = np.unique(prob_calibrada)
+    cortes, etiquetas, avisos = [], [ETIQUETAS_BANDAS[0]], []
+    for cuantil, etiqueta in zip(CUANTILES_BANDAS, ETIQUETAS_BANDAS[1:]):
+        corte = float(np.quantile(prob_calibrada, cuantil))
+        # La banda bajo el corte debe contener algún valor calibrado
+        desde = valores[valores >= cortes[-1]] if cortes else valores
+        if not (desde < corte).any():
+            siguientes = desde[desde > desde[0]]
+            if len(siguientes) == 0:
+                etiquetas[-1] = f"{etiquetas[-1]} / {etiqueta}"
+                avisos.append(f"sin valores calibrados distintos para separar {etiqueta!r}; banda unida a la anterior")
+                continue
+            avisos.append(f"corte de {etiqueta!r} movido de {corte:.3f} a {siguientes[0]:.3f} (cuantiles repetidos)")
+            corte = float(siguientes[0])
+        cortes.append(corte)
+        etiquetas.append(etiqueta)
+    return np.array(cortes), etiquetas, avisos
+
+
+def dividir_holdout(y_tarde, semilla=42):
+    """Máscara de la parte de evaluación, estratificada por la clase."""
+    rng = np.random.default_rng(semilla)
+    evaluacion = np.zeros(len(y_tarde), dtype=bool)
+    for clase in (False, True):
+        indices = np.flatnonzero(y_tarde == clase)
+        n = int(round(len(indices) * FRACCION_EVALUACION))
+        evaluacion[rng.choice(indices, n, replace=False)] = True
+    return evaluacion
+
+
+def calcular_calibracion(pipe, ruta_holdout, metodo="isotonica"):
+    entradas, y_tarde = leer_holdout(ruta_holdout)
+    evaluacion = dividir_holdout(y_tarde)
+    for parte, nombre in ((~evaluacion, "ajuste"), (evaluacion, "evaluación")):
+        if y_tarde[parte].all() or not y_tarde[parte].any():
+            raise ValueError(f"La parte de {nombre} del holdout necesita envíos válidos a tiempo y con retraso")
+    # La clase 0 del modelo es "tarde"
+    prob = pipe.predict_proba(entradas)[:, 0]
+
+    # Curva, umbral y cortes se ajustan con una parte del holdout...
+    x, y = ajustar_curva(prob[~evaluacion], y_tarde[~evaluacion], metodo)
+    prob_calibrada = np.interp(prob, x, y)
+    umbral, _ = umbral_optimo(prob_calibrada[~evaluacion], y_tarde[~evaluacion])
+    cortes, etiquetas, avisos = cortes_bandas(prob_calibrada[~evaluacion])
+    for aviso in avisos:
+        warnings.warn(f"Bandas de riesgo: {aviso}", stacklevel=2)
+
+    # ...y las métricas se miden en la otra, que no intervino en el ajuste
+    prob_eval, cal_eval, y_eval = prob[evaluacion], prob_calibrada[evaluacion], y_tarde[evaluacion]
+    codigos = np.searchsorted(cortes, cal_eval, side="right")
+    envios_banda = np.bincount(codigos, minlength=len(etiquetas))
+    tardes_banda = np.bincount(codigos, weights=y_eval, minlength=len(etiquetas))
+
+    return {
+        "metodo": metodo,
+        "x": x.tolist(),
+        "y": y.tolist(),
+        "umbral": umbral,
+        "bandas": {
+            "cortes": cortes.tolist(),
+            "etiquetas": etiquetas,
+            "envios": envios_banda.astype(int).tolist(),
+            "tasa_tarde": [float(t / e) if e else None for t, e in zip(tardes_banda, envios_banda)],
+            "avisos": avisos,
+        },
+        "metricas": {
+            **metricas_decision(cal_eval, y_eval, umbral),
+            "brier_modelo": float(np.mean((prob_eval - y_eval) ** 2)),
+            "brier_calibrado": float(np.mean((cal_eval - y_eval) ** 2)),
+            "medidas_en": "evaluacion",
+        },
+        "holdout": {
+            "archivo": Path(ruta_holdout).name,
+            "huella": hashlib.sha256(Path(ruta_holdout).read_bytes()).hexdigest()[:12],
+            "filas": int(len(y_tarde)),
+            "filas_ajuste": int((~evaluacion).sum()),
+            "filas_evaluacion": int(evaluacion.sum()),
+            "tasa_tarde": float(y_tarde.mean()),
+        },
+    }
+
+
+def publicar(directorio="artefactos", ruta_casos=RUTA_CASOS, ruta_holdout=None, metodo="isotonica"):
+    """Escribe la publicación de cada modelo configurado; devuelve {modelo: ruta}.
+
+    Sin holdout se conserva la calibración ya publicada para esa versión, si la hay.
+    """
+    servidor = ServidorModelos(directorio)
+    casos = cargar_casos(ruta_casos)
+    escritos = {}
+    for nombre, pipe in servidor.modelos.items():
+        version = servidor.versiones[nombre]
+        publicacion = {
+            "modelo": nombre,
+            "version": version,
+            "publicado": datetime.now().isoformat(timespec="seconds"),
+            "casos": precalcular_casos(pipe, casos),
+        }
+        if ruta_holdout is not None:
+            publicacion["calibracion"] = calcular_calibracion(pipe, ruta_holdout, metodo)
+        elif "calibracion" in servidor.publicaciones[nombre]:
+            publicacion["calibracion"] = servidor.publicaciones[nombre]["calibracion"]
+        ruta = ruta_publicacion(directorio, version)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_text(json.dumps(publicacion, ensure_ascii=False, indent=2), encoding="utf-8")
+        escritos[nombre] = ruta
+    return escritos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalcular salidas por versión de modelo")
+    parser.add_argument("--directorio", default="artefactos")
+    parser.add_argument("--casos", default=str(RUTA_CASOS))
+    parser.add_argument("--holdout", help="CSV o Parquet con las 14 variables y EntregaATiempo")
+    parser.add_argument("--calibracion", choices=["isotonica", "platt"], default="isotonica")
+    args = parser.parse_args()
+
+    for nombre, ruta in publicar(args.directorio, args.casos, args.holdout, args.calibracion).items():
+        calibracion = json.loads(ruta.read_text(encoding="utf-8")).get("calibracion")
+        print(f"{nombre} -> {ruta}")
+        if calibracion:
+            m = calibracion["metricas"]
+            print(
+                f"  {calibracion['metodo']}: umbral {calibracion['umbral']:.3f} | F1 {m['f1']:.3f} | "
+                f"Brier {m['brier_modelo']:.4f} -> {m['brier_calibrado']:.4f} "
+                f"({calibracion['holdout']['filas_evaluacion']:,} envíos de evaluación) | "
+                f"cortes de banda {[round(c, 3) for c in calibracion['bandas']['cortes']]}"
+            )
+            for aviso in calibracion["bandas"].get("avisos", []):
+                print(f"  ⚠️ {aviso}")
+
+
+if __name__ == "__main__":
+    main()
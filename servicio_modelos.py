@@ -0,0 +1,257 @@
+# servicio_modelos.py
+# Servicio de modelos: un primario, modelos en sombra y ruteo A/B.
+#
+# Configuración opcional en artefactos/modelos.json:
+# {
+#     "primario": "modelo_entregas_mlp.pkl",
+#     "sombras": ["modelo_entregas_mlp_v2.pkl"],
+#     "ab": {"modelo_entregas_mlp.pkl": 0.9, "modelo_entregas_mlp_v2.pkl": 0.1},
+#     "presupuesto_ms": 50
+# }
+# Sin ese archivo solo se sirve modelo_entregas_mlp.pkl.
+#
+# publicar.py deja en artefactos/versiones/<version>.json lo precalculado para
+# cada versión de modelo (hash del .pkl): las salidas de los casos predefinidos
+# y, si se publicó con un holdout, la calibración, el umbral y las bandas de riesgo.
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+MODELO_PRIMARIO = "modelo_entregas_mlp.pkl"
+ARCHIVO_CONFIG = "modelos.json"
+DIRECTORIO_VERSIONES = "versiones"
+
+
+def firma_artefactos(directorio):
+    """Fechas de modificación de los artefactos; cambia si se publica un modelo."""
+    directorio = Path(directorio)
+    archivos = (
+        sorted(directorio.glob("*.pkl"))
+        + sorted(directorio.glob(ARCHIVO_CONFIG))
+        + sorted(directorio.glob(f"{DIRECTORIO_VERSIONES}/*.json"))
+    )
+    return tuple((str(a.relative_to(directorio)), a.stat().st_mtime) for a in archivos)
+
+
+def version_artefacto(ruta):
+    """Versión de un modelo: hash de su archivo, estable entre copias y despliegues."""
+    return hashlib.sha256(Path(ruta).read_bytes()).hexdigest()[:12]
+
+
+def ruta_publicacion(directorio, version):
+    return Path(directorio) / DIRECTORIO_VERSIONES / f"{version}.json"
+
+
+def cubeta_envio(id_envio):
+    """Número estable en [0, 1) a partir del ID de envío."""
+    digest = hashlib.sha1(str(id_envio).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) / 2 ** 32
+
+
+class CalibracionModelo:
+    """Calibración publicada de un modelo, aplicada como búsquedas vectorizadas.
+
+    La curva (isotónica o Platt) viene como puntos para np.interp y las bandas
+    como cortes para np.searchsorted: nada se ajusta al servir.
+    """
+
+    def __init__(self, publicada):
+        self.metodo = publicada["metodo"]
+        self.x = np.asarray(publicada["x"], dtype=float)
+        self.y = np.asarray(publicada["y"], dtype=float)
+        self.umbral = float(publicada["umbral"])
+        self.cortes = np.asarray(publicada["bandas"]["cortes"], dtype=float)
+        self.etiquetas = np.asarray(publicada["bandas"]["etiquetas"], dtype=object)
+
+    def calibrar(self, prob_tarde):
+        return np.interp(prob_tarde, self.x, self.y)
+
+    def codigos_banda(self, prob_calibrada):
+        return np.searchsorted(self.cortes, prob_calibrada, side="right")
+
+    def banda(self, prob_calibrada):
+        return self.etiquetas[self.codigos_banda(prob_calibrada)]
+
+
+class ServidorModelos:
+    """Responde con un modelo y evalúa el resto en sombra, fuera del camino crítico.
+
+    Las sombras corren en un pool de hilos después de que el primario ya
+    respondió; nunca se espera por ellas. Si una sombra termina fuera del
+    presupuesto de latencia (contado desde que se encola, sin el tiempo del
+    primario) se descarta su resultado, y si hay demasiadas pendientes ni
+    siquiera se encola.
+    """
+
+    def __init__(self, directorio="artefactos", max_hilos=2, max_pendientes=32, registro=None):
+        self.directorio = Path(directorio)
+        config = {}
+        ruta_config = self.directorio / ARCHIVO_CONFIG
+        if ruta_config.exists():
+            config = json.loads(ruta_config.read_text(encoding="utf-8"))
+
+        self.primario = config.get("primario", MODELO_PRIMARIO)
+        self.sombras = list(config.get("sombras", []))
+        self.pesos_ab = dict(config.get("ab", {}))
+        self.presupuesto_s = config.get("presupuesto_ms", 50) / 1000
+
+        nombres = [self.primario] + self.sombras + list(self.pesos_ab)
+        self.modelos = {}
+        self.versiones = {}
+        self.publicaciones = {}
+        self.calibraciones = {}
+        for nombre in dict.fromkeys(nombres):
+            self.modelos[nombre] = joblib.load(self.directorio / nombre)
+            self.versiones[nombre] = version_artefacto(self.directorio / nombre)
+            ruta = ruta_publicacion(self.directorio, self.versiones[nombre])
+            self.publicaciones[nombre] = json.loads(ruta.read_text(encoding="utf-8")) if ruta.exists() else {}
+            if "calibracion" in self.publicaciones[nombre]:
+                self.calibraciones[nombre] = CalibracionModelo(self.publicaciones[nombre]["calibracion"])
+
+        total = sum(self.pesos_ab.values())
+        self._cortes_ab = [
+            (nombre, acumulado / total)
+            for nombre, acumulado in zip(self.pesos_ab, np.cumsum(list(self.pesos_ab.values())))
+        ] if total > 0 else []
+
+        self.max_pendientes = max_pendientes
+        self.registro = Path(registro) if registro else None
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="sombra")
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        self._metricas = {
+            nombre: {"n": 0, "acuerdos": 0, "suma_delta": 0.0, "max_delta": 0.0,
+                     "fuera_presupuesto": 0, "descartadas": 0, "errores": 0}
+            for nombre in self.modelos
+        }
+
+    def elegir_modelo(self, id_envio=None):
+        """Modelo que responde: A/B por hash del ID de envío, o el primario."""
+        if id_envio is None or id_envio == "" or not self._cortes_ab:
+            return self.primario
+        cubeta = cubeta_envio(id_envio)
+        for nombre, corte in self._cortes_ab:
+            if cubeta < corte:
+                return nombre
+        return self._cortes_ab[-1][0]
+
+    def caso_precalculado(self, nombre, caso, huella):
+        """Salidas publicadas de un caso predefinido para el modelo, o None si no están o el caso cambió."""
+        precalculado = self.publicaciones[nombre].get("casos", {}).get(caso)
+        if precalculado is None or precalculado["huella"] != huella:
+            return None
+        return precalculado
+
+    def decide_tarde(self, nombre, prob_tarde):
+        """Decisión "tarde" del modelo: con su umbral calibrado si se publicó, si no con 0.5."""
+        calibracion = self.calibraciones.get(nombre)
+        if calibracion is None:
+            return prob_tarde >= 0.5
+        return calibracion.calibrar(prob_tarde) >= calibracion.umbral
+
+    def predecir(self, entrada, id_envio=None):
+        """Probabilidad de retraso del modelo elegido; lanza las sombras en segundo plano."""
+        inicio = time.perf_counter()
+        nombre = self.elegir_modelo(id_envio)
+        # La clase 0 del modelo es "tarde"
+        prob_tarde = self.modelos[nombre].predict_proba(entrada)[:, 0]
+
+        for sombra in self.modelos:
+            if sombra != nombre:
+                self._lanzar_sombra(sombra, entrada, nombre, prob_tarde, id_envio)
+
+        return {
+            "modelo": nombre,
+            "prob_tarde": prob_tarde,
+            "latencia_ms": (time.perf_counter() - inicio) * 1000,
+        }
+
+    def _lanzar_sombra(self, sombra, entrada, servido, prob_servida, id_envio):
+        with self._lock:
+            if self._pendientes >= self.max_pendientes:
+                self._metricas[sombra]["descartadas"] += 1
+                return
+            self._pendientes += 1
+        try:
+            self._pool.submit(
+                self._evaluar_sombra, sombra, entrada, servido, prob_servida, time.perf_counter(), id_envio
+            )
+        except RuntimeError:
+            # El servidor ya se cerró (se reemplazó por uno con otros artefactos)
+            with self._lock:
+                self._pendientes -= 1
+                self._metricas[sombra]["descartadas"] += 1
+
+    def _evaluar_sombra(self, sombra, entrada, servido, prob_servida, inicio, id_envio):
+        try:
+            if time.perf_counter() - inicio > self.presupuesto_s:
+                # Ya venció el presupuesto esperando en la cola
+                with self._lock:
+                    self._metricas[sombra]["fuera_presupuesto"] += 1
+                return
+
+            prob_sombra = self.modelos[sombra].predict_proba(entrada)[:, 0]
+            latencia = time.perf_counter() - inicio
+            if latencia > self.presupuesto_s:
+                with self._lock:
+                    self._metricas[sombra]["fuera_presupuesto"] += 1
+                return
+
+            delta = prob_sombra - prob_servida
+            # Cada modelo decide con su propio umbral (calibrado si se publicó)
+            acuerdos = int(
+                (self.decide_tarde(sombra, prob_sombra) == self.decide_tarde(servido, prob_servida)).sum()
+            )
+            with self._lock:
+                m = self._metricas[sombra]
+                m["n"] += len(delta)
+                m["acuerdos"] += acuerdos
+                m["suma_delta"] += float(delta.sum())
+                m["max_delta"] = max(m["max_delta"], float(np.abs(delta).max()))
+                if self.registro is not None:
+                    with self.registro.open("a", encoding="utf-8") as f:
+                        f.write(json.dumps({
+                            "ts": time.time(),
+                            "id_envio": id_envio,
+                            "sombra": sombra,
+                            "prob_servida": prob_servida.round(6).tolist(),
+                            "prob_sombra": prob_sombra.round(6).tolist(),
+                            "latencia_ms": round(latencia * 1000, 3),
+                        }) + "\n")
+        except Exception:
+            with self._lock:
+                self._metricas[sombra]["errores"] += 1
+        finally:
+            with self._lock:
+                self._pendientes -= 1
+
+    def cerrar(self):
+        """Libera el pool de sombras; las pendientes que no empezaron se cancelan."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def resumen(self):
+        """Acuerdo y diferencia de score de cada modelo evaluado en sombra."""
+        with self._lock:
+            filas = []
+            for nombre, m in self._metricas.items():
+                evaluadas = m["n"] + m["fuera_presupuesto"] + m["descartadas"] + m["errores"]
+                if evaluadas == 0:
+                    continue
+                filas.append({
+                    "modelo": nombre,
+                    "comparaciones": m["n"],
+                    "acuerdo_pct": 100 * m["acuerdos"] / m["n"] if m["n"] else np.nan,
+                    "delta_medio": m["suma_delta"] / m["n"] if m["n"] else np.nan,
+                    "delta_max": m["max_delta"],
+                    "fuera_presupuesto": m["fuera_presupuesto"],
+                    "descartadas": m["descartadas"],
+                    "errores": m["errores"],
+                })
+        return pd.DataFrame(filas)
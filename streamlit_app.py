@@ -1,15 +1,19 @@
 # streamlit_app.py (VERSIÓN COMPLETA CON PREDICCIÓN Y CLUSTERING)
-import joblib
 import streamlit as st
 import pandas as pd
 from pathlib import Path
 import numpy as np
 from datetime import datetime, timedelta
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
 import plotly.express as px
 import plotly.graph_objects as go
+from clustering_conductores import RUTA_MODELO_FLOTA, analizar_conductor, cargar_modelo_flota
+from esquema import VALIDADOR_CONDUCTOR, VALIDADOR_ENVIO
+from explicabilidad import ExplicadorMLP
+from exportacion import buffer_parquet, categorias_modelo, tabla_predicciones, tabla_segmentacion
+from historial_scores import HistorialScores
+from prediccion import RUTA_CASOS, cargar_casos, construir_entrada, hora_salida_caso
+from servicio_modelos import ServidorModelos, firma_artefactos
+from telemetria import AlmacenTelemetria
 
 # ==========================
 # Configuración de la página
@@ -34,17 +38,178 @@ modulo = st.radio(
 
 st.markdown("---")
 
+
+@st.cache_resource
+def cargar_modelo_flota_cache(fecha_modelo):
+    return cargar_modelo_flota(RUTA_MODELO_FLOTA)
+
+
+@st.cache_data(max_entries=256, show_spinner="Analizando conductor...")
+def analizar_conductor_cache(fecha_modelo_flota, **datos_conductor):
+    # Con un modelo de flota ajustado se compara contra toda la flota;
+    # si no, contra la flota simulada de siempre
+    modelo_flota = cargar_modelo_flota_cache(fecha_modelo_flota)
+    if modelo_flota is not None:
+        return modelo_flota.analizar_conductor(datos_conductor)
+    return analizar_conductor(datos_conductor)
+
+
+@st.cache_data(max_entries=4)
+def cargar_features_telemetria(directorio, firma):
+    # firma: se vuelve a leer solo cuando cambia algún mes del almacén
+    return AlmacenTelemetria(directorio).features()
+
+
+@st.cache_resource
+def cargar_historial():
+    # Una instancia por proceso: reutiliza el dataset mientras no cambien los archivos
+    return HistorialScores()
+
+
+@st.cache_data(max_entries=16)
+def transiciones_cache(mes_origen, mes_destino, firma):
+    # firma: se recalcula solo cuando se anexan scores
+    return cargar_historial().matriz_transiciones(mes_origen, mes_destino)
+
+
+@st.fragment
+def mostrar_analisis_conductor(resultado, datos):
+    # Fragmento: interactuar con los paneles no vuelve a ejecutar el script completo
+    st.subheader("📊 Resultados del Análisis")
+    st.caption(f"Comparado con: {resultado['referencia']}")
+    
+    col_m1, col_m2, col_m3 = st.columns(3)
+    
+    with col_m1:
+        st.metric("🎯 Cluster Asignado", resultado["cluster"])
+    
+    with col_m2:
+        st.metric("⚠️ Nivel de Riesgo", resultado["nivel_riesgo"])
+    
+    with col_m3:
+        st.metric("👨‍💼 Nivel de Experticia", resultado["nivel_exp"])
+    
+    st.markdown("---")
+    
+    # Mostrar los 3 PCA como scores
+    st.markdown("### 🎛 Scores PCA por dimensión")
+    
+    c1, c2, c3 = st.columns(3)
+    
+    with c1:
+        st.metric(
+            "Score de Riesgo (0-100)",
+            f"{resultado['score_riesgo']:.1f}%",
+            help="Basado en frenadas duras, excesos de velocidad, incidentes con carga e infracciones. Mayor score = Mayor riesgo"
+        )
+        st.write(f"Nivel de riesgo: **{resultado['nivel_riesgo']}**")
+        
+        # Mostrar loadings para transparencia
+        with st.expander("📊 Ver contribución de variables"):
+            for var, loading in resultado["loadings_riesgo"].items():
+                st.write(f"- {var}: {loading:.3f}")
+    
+    with c2:
+        st.metric(
+            "Score de Experticia (0-100)",
+            f"{resultado['score_exp']:.1f}%",
+            help="Basado en horas de manejo, km recorridos y entregas realizadas."
+        )
+        st.write(f"Nivel de experticia: **{resultado['nivel_exp']}**")
+        
+        with st.expander("📊 Ver contribución de variables"):
+            for var, loading in resultado["loadings_exp"].items():
+                st.write(f"- {var}: {loading:.3f}")
+    
+    with c3:
+        st.metric(
+            "Índice Seguridad / Fatiga (0-100)",
+            f"{resultado['score_seg']:.1f}%",
+            help="Basado en reclamos, accidentes, capacitaciones y nivel de fatiga."
+        )
+        st.write(f"Situación: **{resultado['nivel_seg']}**")
+    
+    st.markdown("---")
+    
+    # Análisis de características del cluster
+    st.markdown("### 🔍 Características del Cluster")
+    
+    stats_cluster = resultado["promedios_cluster"]
+    if stats_cluster is not None:
+        col_s1, col_s2 = st.columns(2)
+        
+        with col_s1:
+            st.markdown("#### Promedios del Cluster")
+            st.write(f"**Frenadas Duras:** {stats_cluster['frenadas_duras']:.1f}")
+            st.write(f"**Excesos Velocidad:** {stats_cluster['excesos_velocidad']:.1f}")
+            st.write(f"**Incidentes Carga:** {stats_cluster['incidentes_carga']:.1f}")
+            st.write(f"**Infracciones:** {stats_cluster['infracciones']:.1f}")
+            st.write(f"**Accidentes Leves:** {stats_cluster['accidentes_leves']:.1f}")
+        
+        with col_s2:
+            st.markdown("#### Tus Valores")
+            st.write(f"**Frenadas Duras:** {datos['frenadas_duras']}")
+            st.write(f"**Excesos Velocidad:** {datos['excesos_velocidad']}")
+            st.write(f"**Incidentes Carga:** {datos['incidentes_carga']}")
+            st.write(f"**Infracciones:** {datos['infracciones']}")
+            st.write(f"**Accidentes Leves:** {datos['accidentes_leves']}")
+    
+    # Recomendaciones según cluster
+    st.markdown("### 💡 Recomendaciones")
+    
+    if "MAESTRO_IDEAL" in resultado["cluster"]:
+        st.success("¡Excelente desempeño! Mantén tus buenos hábitos de conducción y seguridad.")
+    elif "NOVATO_SEGURO" in resultado["cluster"]:
+        st.info("Buen perfil de seguridad. Aumenta tu experiencia y productividad para avanzar.")
+    elif "EXPERTO_RIESGOSO" in resultado["cluster"]:
+        st.warning("Alta experiencia pero con comportamientos riesgosos. Reduce infracciones y mejora hábitos de conducción.")
+    else:
+        st.error("Requiere atención inmediata. Necesitas mejorar tanto en experiencia como en seguridad.")
+
+
+@st.cache_resource
+def servidores_vigentes():
+    # Último servidor construido por directorio, para cerrarlo al reemplazarlo
+    return {}
+
+
+@st.cache_resource(max_entries=1)
+def cargar_servidor(directorio, firma):
+    # Se recarga solo si cambia algún artefacto (firma = nombres + fechas); el
+    # anterior sale de la caché y se cierra su pool de sombras
+    servidor = ServidorModelos(directorio, registro=Path(directorio) / "sombras.jsonl")
+    anterior = servidores_vigentes().get(directorio)
+    if anterior is not None:
+        anterior.cerrar()
+    servidores_vigentes()[directorio] = servidor
+    return servidor
+
+
+@st.cache_resource(max_entries=1)
+def cargar_casos_cache(ruta, fecha_modificacion):
+    # Una lectura por proceso; se vuelve a leer si operaciones edita el archivo
+    return cargar_casos(ruta)
+
+
+@st.cache_resource(max_entries=4)
+def cargar_explicador(_pipe, nombre_modelo, firma):
+    # Se construye una vez por modelo servido (primario y brazos A/B); su caché de
+    # explicaciones sobrevive a los reruns. Al cambiar la firma, las entradas
+    # viejas son las primeras en salir
+    return ExplicadorMLP(_pipe)
+
 # ==========================
 # MÓDULO 1: PREDICCIÓN
 # ==========================
 if modulo == "🔮 Predicción de Entregas":
     st.write("Predice si una entrega llegará a tiempo basándose en condiciones previas al envío.")
     
-    # Cargar el modelo
-    MODEL_PATH = Path("artefactos/modelo_entregas_mlp.pkl")
+    # Cargar el modelo primario y los modelos en sombra
+    ART_DIR = Path("artefactos")
     
     try:
-        pipe = joblib.load(MODEL_PATH)
+        firma = firma_artefactos(ART_DIR)
+        servidor = cargar_servidor(str(ART_DIR), firma)
         st.success("✅ Modelo cargado exitosamente")
     except Exception as e:
         st.error(f"❌ Error al cargar el modelo: {e}")
@@ -53,144 +218,8 @@ if modulo == "🔮 Predicción de Entregas":
     # ==========================
     # CASOS PREDEFINIDOS
     # ==========================
-    casos_predefinidos = {
-        "Caso 1: Ruta Corta - Condiciones Óptimas": {
-            "descripcion": "Entrega de 50 km en condiciones ideales con amplia ventana de entrega",
-            "datos": {
-                "clima": "Bueno",
-                "trafico": "Bajo",
-                "riesgo_ruta": "Bajo",
-                "distancia_km": 50.0,
-                "tipo_carga": "Normal",
-                "peso_kg": 700,
-                "hora_inicio_entrega": pd.Timestamp("16:30").time(),
-                "hora_fin_entrega": pd.Timestamp("21:45").time(),
-                "experiencia": 5,
-                "antiguedad_camion": 3,
-                "fallas_mecanicas": "No",
-                "nivel_combustible": 90.0
-            },
-            "contexto": {
-                "conductor": "C045",
-                "frenadas_duras": 18,
-                "excesos_velocidad": 5,
-                "infracciones": 2,
-                "incidentes_carga": 1,
-                "accidentes_leves": 1,
-                "reclamos": 3,
-                "horas_mes": 190,
-                "km_mes": 8500,
-                "entregas_mes": 95,
-                "asistencia_capacitacion": "75%",
-                "indice_fatiga": 0.68
-            },
-            "recomendaciones": [
-                "**Conducción**: Mantener ruta y horario actuales con conducción suave; evitar acelerar innecesariamente",
-                "**Ventana de tiempo**: Aprovechar la holgura de la ventana (12:30–21:45); no hay presión de reloj",
-                "**Planificación**: Mantener programación actual, sin cambios de ruta ni horarios",
-                "**Gestión del conductor**: Monitorear frenadas duras, excesos y reclamos; usar esta ruta simple para corregir hábitos con baja presión",
-                "**Capacitación**: Programar capacitación en conducción defensiva, gestión de fatiga y cuidado de carga"
-            ],
-            "riesgos": {
-                "servicio": "Bajo",
-                "seguridad": "Medio (por estilo y fatiga)",
-                "mecanico": "Bajo",
-                "global": "Bajo"
-            }
-        },
-        "Caso 2: Ruta Larga - Clima Adverso": {
-            "descripcion": "Entrega de 200 km con lluvia, tráfico alto y ventana de entrega ajustada",
-            "datos": {
-                "clima": "Lluvia",
-                "trafico": "Alto",
-                "riesgo_ruta": "Bajo",
-                "distancia_km": 200.0,
-                "tipo_carga": "Normal",
-                "peso_kg": 1000,
-                "hora_inicio_entrega": pd.Timestamp("16:30").time(),
-                "hora_fin_entrega": pd.Timestamp("19:00").time(),
-                "experiencia": 5,
-                "antiguedad_camion": 3,
-                "fallas_mecanicas": "No",
-                "nivel_combustible": 80.0
-            },
-            "contexto": {
-                "conductor": "C045",
-                "frenadas_duras": 18,
-                "excesos_velocidad": 5,
-                "infracciones": 2,
-                "incidentes_carga": 1,
-                "accidentes_leves": 1,
-                "reclamos": 3,
-                "horas_mes": 190,
-                "km_mes": 8500,
-                "entregas_mes": 95,
-                "asistencia_capacitacion": "75%",
-                "indice_fatiga": 0.68
-            },
-            "recomendaciones": [
-                "**Conducción**: Prohibir compensar el retraso con exceso de velocidad; exigir conducción defensiva en lluvia y tráfico alto",
-                "**Ventana de tiempo**: Reconocer que la ventana 12:30–16:00 ya es inalcanzable; no forzar la operación",
-                "**Planificación**: Reprogramar la entrega con una nueva franja/fecha basada en el ETA real (~12h 45min)",
-                "**Comunicación con cliente**: Informar de inmediato que no se podrá cumplir la ventana original; acordar nueva franja",
-                "**Rutas alternativas**: Evaluar rutas menos congestionadas solo si no aumentan el riesgo; priorizar seguridad",
-                "**Capacitación**: Capacitación específica en conducción segura con clima adverso y manejo de estrés por retrasos"
-            ],
-            "riesgos": {
-                "servicio": "Muy alto / crítico",
-                "seguridad": "Medio–alto (lluvia + tráfico alto + estilo agresivo + fatiga)",
-                "mecanico": "Bajo",
-                "global": "Alto (dominante por servicio, con componente de seguridad)"
-            }
-        },
-        "Caso 3: Ruta Larga - Riesgo Mecánico": {
-            "descripcion": "Entrega de 400 km con tráfico alto, vehículo con historial de fallas y ventana ajustada",
-            "datos": {
-                "clima": "Bueno",
-                "trafico": "Alto",
-                "riesgo_ruta": "Bajo",
-                "distancia_km": 400.0,
-                "tipo_carga": "Normal",
-                "peso_kg": 1000,
-                "hora_inicio_entrega": pd.Timestamp("16:30").time(),
-                "hora_fin_entrega": pd.Timestamp("19:00").time(),
-                "experiencia": 5,
-                "antiguedad_camion": 3,
-                "fallas_mecanicas": "Si",
-                "nivel_combustible": 80.0
-            },
-            "contexto": {
-                "conductor": "C045",
-                "frenadas_duras": 18,
-                "excesos_velocidad": 5,
-                "infracciones": 2,
-                "incidentes_carga": 1,
-                "accidentes_leves": 1,
-                "reclamos": 3,
-                "horas_mes": 190,
-                "km_mes": 8500,
-                "entregas_mes": 95,
-                "asistencia_capacitacion": "75%",
-                "indice_fatiga": 0.68
-            },
-            "recomendaciones": [
-                "**Conducción**: Conducción defensiva estricta; no intentar recuperar retraso con maniobras agresivas ni exceso de velocidad",
-                "**Ventana de tiempo**: Aceptar que la ventana 12:30–16:00 es inviable con el tiempo estimado disponible",
-                "**Planificación**: Reprogramar considerando ETA extendido y riesgo mecánico, incluso evaluar moverla a otro vehículo/día",
-                "**Comunicación con cliente**: Informar el riesgo mecánico y la necesidad de una reprogramación ordenada y segura",
-                "**Rutas alternativas**: Evaluar rutas menos congestionadas y más seguras, sin exigir al vehículo; considerar dividir el trayecto",
-                "**Gestión del conductor**: Evitar asignarle varias rutas largas seguidas hasta que mejore su fatiga y estilo de conducción",
-                "**Gestión del vehículo**: Realizar revisión mecánica exhaustiva antes de nuevas rutas largas; clasificar como 'en observación'",
-                "**Capacitación**: Capacitación en conducción segura en tráfico denso, gestión de fatiga y prevención de fallas"
-            ],
-            "riesgos": {
-                "servicio": "Muy alto / crítico",
-                "seguridad": "Medio–alto (tráfico alto + estilo agresivo + fatiga)",
-                "mecanico": "Medio–alto (historial de fallas + ruta larga)",
-                "global": "Alto (servicio crítico + riesgos de seguridad y mecánicos)"
-            }
-        }
-    }
+    # Definidos en casos_predefinidos.json (prediccion.py)
+    casos_predefinidos = cargar_casos_cache(str(RUTA_CASOS), RUTA_CASOS.stat().st_mtime)
     
     # ==========================
     # SELECTOR DE MODO
@@ -222,7 +251,7 @@ if modulo == "🔮 Predicción de Entregas":
             st.info(f"📄 **Descripción**: {caso['descripcion']}")
             
             # Mostrar contexto del conductor
-            with st.expander("👤 Contexto del Conductor C045"):
+            with st.expander(f"👤 Contexto del Conductor {caso['contexto']['conductor']}"):
                 ctx = caso['contexto']
                 col_ctx1, col_ctx2, col_ctx3 = st.columns(3)
                 
@@ -250,6 +279,11 @@ if modulo == "🔮 Predicción de Entregas":
     # ==========================
     st.markdown("### 📝 Datos del Envío")
     
+    id_envio = st.text_input(
+        "ID de Envío (opcional)",
+        help="Si hay una prueba A/B configurada, el ID decide qué modelo responde"
+    )
+    
     # Obtener valores del caso o usar valores por defecto
     if caso_seleccionado:
         valores = casos_predefinidos[caso_seleccionado]['datos']
@@ -370,82 +404,84 @@ if modulo == "🔮 Predicción de Entregas":
     
     st.markdown("---")
     
-    # Funciones auxiliares
-    VELOCIDAD_BASE = 40
-    factores_clima = {"Bueno": 1.0, "Lluvia": 0.8, "Tormenta": 0.5}
-    factores_trafico = {"Bajo": 1.0, "Medio": 0.75, "Alto": 0.5}
-    
-    def calcular_tiempo_estimado(distancia, clima, trafico, experiencia, antiguedad):
-        velocidad_efectiva = VELOCIDAD_BASE * factores_clima[clima] * factores_trafico[trafico]
-        
-        if experiencia < 2:
-            velocidad_efectiva *= 0.7
-        elif experiencia < 5:
-            velocidad_efectiva *= 0.85
-        else:
-            velocidad_efectiva *= 1.0
-        
-        if antiguedad > 10:
-            velocidad_efectiva *= 0.85
-        elif antiguedad > 5:
-            velocidad_efectiva *= 0.9
-        
-        tiempo_viaje_horas = distancia / velocidad_efectiva
-        tiempo_minutos = tiempo_viaje_horas * 60
-        tiempo_parada = 15
-        
-        return tiempo_minutos + tiempo_parada
-    
-    def determinar_horario_salida(hora_actual):
-        hora = hora_actual.hour
-        
-        if 6 <= hora < 12:
-            return "Manana"
-        elif 12 <= hora < 18:
-            return "Tarde"
-        else:
-            return "Noche"
+    datos_envio = {
+        "clima": clima,
+        "trafico": trafico,
+        "riesgo_ruta": riesgo_ruta,
+        "distancia_km": distancia_km,
+        "tipo_carga": tipo_carga,
+        "peso_kg": peso_kg,
+        "hora_inicio_entrega": hora_inicio_entrega,
+        "hora_fin_entrega": hora_fin_entrega,
+        "experiencia": experiencia,
+        "antiguedad_camion": antiguedad_camion,
+        "fallas_mecanicas": fallas_mecanicas,
+        "nivel_combustible": nivel_combustible
+    }
     
     # Botón de predicción
     if st.button("🔮 Predecir Entrega", type="primary", use_container_width=True):
         
         hora_actual = datetime.now() - timedelta(hours=5)
-        horario = determinar_horario_salida(hora_actual)
-        
-        tiempo_estimado = calcular_tiempo_estimado(
-            distancia_km, clima, trafico, experiencia, antiguedad_camion
-        )
+        if caso_seleccionado:
+            # Un caso predefinido sale siempre a su hora, para que su resultado sea reproducible
+            hora_actual = hora_salida_caso(casos_predefinidos[caso_seleccionado], hora_actual.date())
+        
+        calculo = construir_entrada(datos_envio, hora_actual)
+        horario = calculo["horario"]
+        tiempo_estimado = calculo["tiempo_estimado"]
+        hora_llegada_estimada = calculo["hora_llegada_estimada"]
+        demora_minutos = calculo["demora_minutos"]
+        nueva_entrada = calculo["entrada"]
+        
+        # Un caso predefinido sin modificar se responde con lo precalculado al
+        # publicar el modelo (publicar.py); cualquier cambio vuelve a inferir
+        modelo_usado = servidor.elegir_modelo(id_envio.strip() or None)
+        precalculado = None
+        if caso_seleccionado and datos_envio == casos_predefinidos[caso_seleccionado]["datos"]:
+            precalculado = servidor.caso_precalculado(
+                modelo_usado, caso_seleccionado, casos_predefinidos[caso_seleccionado]["huella"]
+            )
         
-        hora_llegada_estimada = hora_actual + timedelta(minutes=tiempo_estimado)
-        hora_inicio_ventana = datetime.combine(hora_actual.date(), hora_inicio_entrega)
-        hora_fin_ventana = datetime.combine(hora_actual.date(), hora_fin_entrega)
-        
-        demora_minutos = (hora_llegada_estimada - hora_inicio_ventana).total_seconds() / 60
-        tiempo_real_simulado = tiempo_estimado + (demora_minutos if demora_minutos > 0 else 0)
-        
-        nueva_entrada = pd.DataFrame([{
-            "Clima": clima,
-            "TraficoPico": trafico,
-            "RiesgoRuta": riesgo_ruta,
-            "Distancia_km": distancia_km,
-            "TiempoEstimado_min": tiempo_estimado,
-            "TiempoReal_min": tiempo_real_simulado,
-            "Demora_min": demora_minutos,
-            "TipoCarga": tipo_carga,
-            "Peso_kg": peso_kg,
-            "ExperienciaConductor_anios": experiencia,
-            "AntiguedadCamion_anios": antiguedad_camion,
-            "FallasMecanicas": fallas_mecanicas,
-            "NivelCombustible_pct": nivel_combustible,
-            "HorarioSalida": horario,
-        }])
+        if precalculado is not None:
+            prob_tarde = precalculado["prob_tarde"]
+            explicacion = {
+                "prob_referencia": precalculado["prob_referencia"],
+                "contribuciones": pd.Series(precalculado["contribuciones"])
+            }
+        else:
+            # Los widgets acotan la mayoría de los campos, pero los derivados (tiempos,
+            # horario) se validan igual antes de llegar al modelo
+            validacion = VALIDADOR_ENVIO.validar(nueva_entrada)
+            if validacion.n_invalidas:
+                st.error("❌ Entrada inválida para el modelo: " + "; ".join(validacion.mensajes(0)))
+                st.stop()
+            nueva_entrada = validacion.filas_validas()
+            
+            # El modelo que responde se elige por ID de envío; las sombras corren aparte
+            resultado_modelo = servidor.predecir(nueva_entrada, id_envio.strip() or None)
+            modelo_usado = resultado_modelo["modelo"]
+            prob_tarde = resultado_modelo["prob_tarde"][0]
+            explicador = cargar_explicador(servidor.modelos[modelo_usado], modelo_usado, firma)
+            explicacion = explicador.explicar(nueva_entrada)
+        
+        # Con una calibración publicada para el modelo (publicar.py --holdout), el
+        # veredicto y la banda de riesgo salen de la probabilidad calibrada;
+        # sin ella se mantiene la regla de la demora estimada
+        calibracion = servidor.calibraciones.get(modelo_usado)
+        if calibracion is not None:
+            prob_calibrada = float(calibracion.calibrar(prob_tarde))
+            banda_servicio = calibracion.banda(prob_calibrada)
+            llega_tarde = prob_calibrada >= calibracion.umbral
+        else:
+            llega_tarde = demora_minutos > 0
         
         st.subheader("📊 Análisis de Tiempos")
         
         col_a, col_b, col_c, col_d = st.columns(4)
         
         with col_a:
-            st.metric("🕐 Hora Actual", hora_actual.strftime("%H:%M"))
+            st.metric("🕐 Hora de Salida" if caso_seleccionado else "🕐 Hora Actual", hora_actual.strftime("%H:%M"))
             st.caption(f"Horario: {horario}")
         
         with col_b:
@@ -463,10 +499,56 @@ if modulo == "🔮 Predicción de Entregas":
         
         st.info(f"🎯 **Ventana de entrega:** {hora_inicio_entrega.strftime('%H:%M')} - {hora_fin_entrega.strftime('%H:%M')}")
         
-        if demora_minutos <= 0:
+        if not llega_tarde:
             st.success("✅ Llegará a tiempo")
         else:
             st.error("❌ Llegará tarde")
+        if calibracion is not None:
+            st.caption(
+                f"Riesgo de servicio: **{banda_servicio}** · probabilidad calibrada de retraso "
+                f"{prob_calibrada:.1%} (umbral {calibracion.umbral:.1%}, calibración {calibracion.metodo})"
+            )
+        
+        # ==========================
+        # ATRIBUCIÓN DE VARIABLES
+        # ==========================
+        contribuciones = explicacion["contribuciones"]
+        
+        st.markdown("#### 🧭 Variables que influyen en la predicción")
+        st.caption(
+            f"Probabilidad de retraso según `{modelo_usado}`: "
+            f"**{prob_tarde:.1%}** "
+            f"(envío promedio: {explicacion['prob_referencia']:.1%}). "
+            + ("Resultado precalculado para esta versión del modelo. " if precalculado is not None else "")
+            + "Barras rojas aumentan el riesgo de retraso; verdes lo reducen."
+        )
+        
+        df_contrib = pd.DataFrame({
+            "Variable": contribuciones.index,
+            "Contribución": contribuciones.values * 100,
+            "Valor": [str(nueva_entrada.iloc[0][v]) for v in contribuciones.index],
+            "Efecto": np.where(contribuciones.values > 0, "Aumenta retraso", "Reduce retraso")
+        })
+        fig_contrib = px.bar(
+            df_contrib.iloc[::-1],
+            x="Contribución",
+            y="Variable",
+            orientation="h",
+            color="Efecto",
+            color_discrete_map={"Aumenta retraso": "#d62728", "Reduce retraso": "#2ca02c"},
+            hover_data=["Valor"],
+            labels={"Contribución": "Contribución (puntos % de probabilidad de retraso)"}
+        )
+        fig_contrib.update_layout(height=420, margin=dict(l=10, r=10, t=10, b=10))
+        st.plotly_chart(fig_contrib, use_container_width=True)
+        
+        if len(servidor.modelos) > 1:
+            with st.expander("🧪 Evaluación de modelos en sombra"):
+                st.caption(
+                    f"Presupuesto de latencia por sombra: {servidor.presupuesto_s * 1000:.0f} ms. "
+                    "Las sombras no retrasan la respuesta del modelo principal."
+                )
+                st.dataframe(servidor.resumen(), use_container_width=True, hide_index=True)
         
         # Mostrar recomendaciones si es un caso predefinido
         if caso_seleccionado:
@@ -481,7 +563,7 @@ if modulo == "🔮 Predicción de Entregas":
             
             col_r1, col_r2, col_r3, col_r4 = st.columns(4)
             with col_r1:
-                st.metric("Riesgo de Servicio", riesgos['servicio'])
+                st.metric("Riesgo de Servicio", banda_servicio if calibracion is not None else riesgos['servicio'])
             with col_r2:
                 st.metric("Riesgo de Seguridad", riesgos['seguridad'])
             with col_r3:
@@ -493,6 +575,72 @@ if modulo == "🔮 Predicción de Entregas":
             st.markdown("#### 📋 Acciones Recomendadas")
             for recomendacion in caso['recomendaciones']:
                 st.markdown(f"- {recomendacion}")
+    
+    # ==========================
+    # PUNTUACIÓN POR LOTE
+    # ==========================
+    st.markdown("---")
+    with st.expander("📦 Puntuación por lote (CSV / Parquet)"):
+        pipe_primario = servidor.modelos[servidor.primario]
+        columnas_modelo = list(pipe_primario.feature_names_in_)
+        st.caption(
+            "El archivo debe traer las 14 variables del modelo "
+            f"({', '.join(columnas_modelo)}); opcionalmente `id_envio` y `fecha`."
+        )
+        archivo_lote = st.file_uploader("Archivo de envíos", type=["csv", "parquet"])
+        
+        if archivo_lote is not None:
+            clave_lote = (archivo_lote.file_id, firma)
+            # El Parquet se genera una sola vez por archivo; los reruns reutilizan el buffer
+            if st.session_state.get("lote", {}).get("clave") != clave_lote:
+                if archivo_lote.name.endswith(".parquet"):
+                    envios = pd.read_parquet(archivo_lote)
+                else:
+                    envios = pd.read_csv(archivo_lote)
+                # Las filas inválidas se separan en lugar de llegar al modelo
+                # (el OneHotEncoder ignora en silencio las categorías desconocidas)
+                validacion = VALIDADOR_ENVIO.validar(envios)
+                envios_validos = validacion.filas_validas(extras=True)
+                prob_tarde_lote = (
+                    pipe_primario.predict_proba(envios_validos[columnas_modelo])[:, 0]
+                    if len(envios_validos) else np.empty(0)
+                )
+                tabla_lote = tabla_predicciones(
+                    envios_validos,
+                    prob_tarde_lote,
+                    categorias_modelo(pipe_primario),
+                    modelo=servidor.primario,
+                    fecha=None if "fecha" in envios else datetime.now().date(),
+                    calibracion=servidor.calibraciones.get(servidor.primario)
+                )
+                st.session_state["lote"] = {
+                    "clave": clave_lote,
+                    "filas": tabla_lote.num_rows,
+                    "invalidas": validacion.n_invalidas,
+                    "errores": validacion.resumen(),
+                    # La predicción de la tabla ya aplica el umbral calibrado, si lo hay
+                    "tardes": int(np.sum(tabla_lote["prediccion"].combine_chunks().indices)) if tabla_lote.num_rows else 0,
+                    "parquet": buffer_parquet(tabla_lote).to_pybytes()
+                }
+            
+            lote = st.session_state["lote"]
+            col_l1, col_l2, col_l3 = st.columns(3)
+            with col_l1:
+                st.metric("Envíos puntuados", f"{lote['filas']:,}")
+            with col_l2:
+                st.metric("Predichos con retraso", f"{lote['tardes']:,}")
+            with col_l3:
+                st.metric("Filas rechazadas", f"{lote['invalidas']:,}")
+            if lote["invalidas"]:
+                st.warning("⚠️ Filas con valores inválidos o faltantes por columna (no se puntuaron):")
+                st.dataframe(lote["errores"], use_container_width=True)
+            if lote["filas"]:
+                st.download_button(
+                    "⬇️ Descargar resultados (Parquet)",
+                    data=lote["parquet"],
+                    file_name="predicciones_entregas.parquet",
+                    mime="application/vnd.apache.parquet"
+                )
 
 # ==========================
 # MÓDULO 2: CLUSTERING + PCA
@@ -502,7 +650,7 @@ else:
     
     st.markdown("### 👤 Ingrese los datos del conductor")
     
-    # Definir límites máximos
+    # Topes de los widgets del formulario (no son rangos de validez de los datos)
     limites = {
         "frenadas_duras": 50,
         "excesos_velocidad": 30,
@@ -517,6 +665,68 @@ else:
         "indice_fatiga": 10
     }
     
+    valores_conductor = {
+        "frenadas_duras": 5,
+        "excesos_velocidad": 2,
+        "incidentes_carga": 1,
+        "infracciones": 0,
+        "horas_manejo_mes": 160,
+        "km_mes": 4000,
+        "entregas_mes": 120,
+        "reclamos_clientes": 2,
+        "accidentes_leves": 0,
+        "asistencia_capacitaciones": 8,
+        "indice_fatiga": 4
+    }
+    
+    # Métricas agregadas desde la telemetría de los vehículos (telemetria.py)
+    almacen_telemetria = AlmacenTelemetria()
+    if almacen_telemetria.existe():
+        with st.expander("📡 Cargar métricas desde telemetría"):
+            features_telemetria = cargar_features_telemetria(
+                str(almacen_telemetria.directorio), almacen_telemetria.firma()
+            )
+            col_t1, col_t2 = st.columns(2)
+            with col_t1:
+                conductor_telemetria = st.selectbox(
+                    "Conductor",
+                    options=[""] + sorted(features_telemetria["conductor"].unique()),
+                    help="Conductores con eventos de telemetría ingeridos"
+                )
+            with col_t2:
+                meses_conductor = features_telemetria.loc[
+                    features_telemetria["conductor"] == conductor_telemetria, "mes"
+                ]
+                mes_telemetria = st.selectbox(
+                    "Mes",
+                    options=sorted(meses_conductor, reverse=True),
+                    disabled=not conductor_telemetria
+                )
+            
+            if conductor_telemetria and mes_telemetria:
+                fila = features_telemetria[
+                    (features_telemetria["conductor"] == conductor_telemetria)
+                    & (features_telemetria["mes"] == mes_telemetria)
+                ]
+                validacion = VALIDADOR_CONDUCTOR.validar(fila)
+                if validacion.n_invalidas:
+                    st.error(
+                        f"❌ Las métricas de **{conductor_telemetria}** en **{mes_telemetria}** no son válidas: "
+                        + "; ".join(validacion.mensajes(0))
+                    )
+                else:
+                    fila = validacion.filas_validas().iloc[0]
+                    # Valores válidos que exceden el tope de un widget se recortan para mostrarlos
+                    recortadas = []
+                    for col, limite in limites.items():
+                        valor = int(round(float(fila[col])))
+                        if valor > limite:
+                            recortadas.append(col)
+                        valores_conductor[col] = min(valor, limite)
+                    st.caption(f"Métricas de **{conductor_telemetria}** en **{mes_telemetria}** cargadas en el formulario.")
+                    if recortadas:
+                        st.warning("⚠️ Valores recortados al máximo del formulario: " + ", ".join(recortadas))
+    
     col1, col2, col3 = st.columns(3)
     
     with col1:
@@ -525,7 +735,7 @@ else:
             "Frenadas Duras",
             min_value=0,
             max_value=limites["frenadas_duras"],
-            value=5,
+            value=valores_conductor["frenadas_duras"],
             help="Número de frenadas bruscas en el período"
         )
         
@@ -533,7 +743,7 @@ else:
             "Excesos de Velocidad",
             min_value=0,
             max_value=limites["excesos_velocidad"],
-            value=2,
+            value=valores_conductor["excesos_velocidad"],
             help="Número de veces que excedió el límite de velocidad"
         )
         
@@ -541,7 +751,7 @@ else:
             "Incidentes con Carga",
             min_value=0,
             max_value=limites["incidentes_carga"],
-            value=1,
+            value=valores_conductor["incidentes_carga"],
             help="Problemas con la carga (daños, pérdidas)"
         )
         
@@ -549,7 +759,7 @@ else:
             "Infracciones de Tránsito",
             min_value=0,
             max_value=limites["infracciones"],
-            value=0,
+            value=valores_conductor["infracciones"],
             help="Multas o infracciones registradas"
         )
     
@@ -559,7 +769,7 @@ else:
             "Horas de Manejo al Mes",
             min_value=0,
             max_value=limites["horas_manejo_mes"],
-            value=160,
+            value=valores_conductor["horas_manejo_mes"],
             help="Total de horas conduciendo en el mes"
         )
         
@@ -567,7 +777,7 @@ else:
             "Kilómetros al Mes",
             min_value=0,
             max_value=limites["km_mes"],
-            value=4000,
+            value=valores_conductor["km_mes"],
             step=100,
             help="Distancia total recorrida en el mes"
         )
@@ -576,7 +786,7 @@ else:
             "Entregas al Mes",
             min_value=0,
             max_value=limites["entregas_mes"],
-            value=120,
+            value=valores_conductor["entregas_mes"],
             help="Número de entregas completadas"
         )
         
@@ -584,7 +794,7 @@ else:
             "Reclamos de Clientes",
             min_value=0,
             max_value=limites["reclamos_clientes"],
-            value=2,
+            value=valores_conductor["reclamos_clientes"],
             help="Quejas o reclamos recibidos"
         )
     
@@ -594,7 +804,7 @@ else:
             "Accidentes Leves",
             min_value=0,
             max_value=limites["accidentes_leves"],
-            value=0,
+            value=valores_conductor["accidentes_leves"],
             help="Accidentes menores sin heridos graves"
         )
         
@@ -602,7 +812,7 @@ else:
             "Asistencia a Capacitaciones",
             min_value=0,
             max_value=limites["asistencia_capacitaciones"],
-            value=8,
+            value=valores_conductor["asistencia_capacitaciones"],
             help="Número de capacitaciones completadas en el año"
         )
         
@@ -610,268 +820,132 @@ else:
             "Índice de Fatiga",
             min_value=0,
             max_value=limites["indice_fatiga"],
-            value=4,
+            value=valores_conductor["indice_fatiga"],
             help="Nivel de fatiga promedio (0=ninguna, 10=extrema)"
         )
     
     st.markdown("---")
     
     # Botón de análisis
+    datos_conductor = {
+        "frenadas_duras": frenadas_duras,
+        "excesos_velocidad": excesos_velocidad,
+        "incidentes_carga": incidentes_carga,
+        "infracciones": infracciones,
+        "horas_manejo_mes": horas_manejo_mes,
+        "km_mes": km_mes,
+        "entregas_mes": entregas_mes,
+        "reclamos_clientes": reclamos_clientes,
+        "accidentes_leves": accidentes_leves,
+        "asistencia_capacitaciones": asistencia_capacitaciones,
+        "indice_fatiga": indice_fatiga
+    }
+    
     if st.button("📈 Analizar Conductor", type="primary", use_container_width=True):
+        # Se calcula una vez por combinación de datos; los reruns reutilizan el resultado
+        st.session_state["analisis_conductor"] = {
+            "datos": datos_conductor,
+            "resultado": analizar_conductor_cache(
+                RUTA_MODELO_FLOTA.stat().st_mtime if RUTA_MODELO_FLOTA.exists() else None,
+                **datos_conductor
+            )
+        }
     
-        # Crear DataFrame con los datos
-        datos_conductor = pd.DataFrame([{
-            "frenadas_duras": frenadas_duras,
-            "excesos_velocidad": excesos_velocidad,
-            "incidentes_carga": incidentes_carga,
-            "infracciones": infracciones,
-            "horas_manejo_mes": horas_manejo_mes,
-            "km_mes": km_mes,
-            "entregas_mes": entregas_mes,
-            "reclamos_clientes": reclamos_clientes,
-            "accidentes_leves": accidentes_leves,
-            "asistencia_capacitaciones": asistencia_capacitaciones,
-            "indice_fatiga": indice_fatiga
-        }])
-        
-        # Generar datos sintéticos para comparación
-        np.random.seed(42)
-        n_conductores = 200
-        
-        datos_simulados = pd.DataFrame({
-            "frenadas_duras": np.random.poisson(8, n_conductores),
-            "excesos_velocidad": np.random.poisson(4, n_conductores),
-            "incidentes_carga": np.random.poisson(2, n_conductores),
-            "infracciones": np.random.poisson(1, n_conductores),
-            "horas_manejo_mes": np.random.normal(160, 30, n_conductores).clip(80, 220),
-            "km_mes": np.random.normal(4500, 1000, n_conductores).clip(1000, 8000),
-            "entregas_mes": np.random.normal(120, 40, n_conductores).clip(30, 300),
-            "reclamos_clientes": np.random.poisson(3, n_conductores),
-            "accidentes_leves": np.random.poisson(1, n_conductores),
-            "asistencia_capacitaciones": np.random.normal(6, 2, n_conductores).clip(0, 12),
-            "indice_fatiga": np.random.normal(5, 2, n_conductores).clip(0, 10)
-        })
-        
-        # Combinar datos
-        datos_completos = pd.concat([datos_simulados, datos_conductor], ignore_index=True)
-        
-        # ================================
-        # PCA POR BLOQUES (3 SCORES)
-        # ================================
-        cols_riesgo = ["frenadas_duras", "excesos_velocidad", "incidentes_carga", "infracciones"]
-        cols_experiencia = ["horas_manejo_mes", "km_mes", "entregas_mes"]
-        cols_seguridad = ["reclamos_clientes", "accidentes_leves", "asistencia_capacitaciones", "indice_fatiga"]
-        
-        def escalar_0_100(valor, todos):
-            vmin = todos.min()
-            vmax = todos.max()
-            if vmax == vmin:
-                return 50.0
-            return 100 * (valor - vmin) / (vmax - vmin)
-        
-        # --- PCA 1: Score de Riesgo ---
-        scaler_riesgo = StandardScaler()
-        riesgo_scaled = scaler_riesgo.fit_transform(datos_completos[cols_riesgo])
-        pca_riesgo = PCA(n_components=1)
-        riesgo_pc1 = pca_riesgo.fit_transform(riesgo_scaled).flatten()
-        
-        # CORRECCIÓN: Verificar dirección del PCA de riesgo
-        # Los loadings indican cómo cada variable contribuye al componente
-        loadings_riesgo = pca_riesgo.components_[0]
-        
-        # Calcular el promedio de los loadings (todas las variables de riesgo deben contribuir positivamente)
-        # Si la mayoría son negativos, invertimos la dirección
-        if np.mean(loadings_riesgo) < 0:
-            riesgo_pc1 = -riesgo_pc1
-        
-        score_riesgo = escalar_0_100(riesgo_pc1[-1], riesgo_pc1)
-        
-        if score_riesgo < 33:
-            nivel_riesgo = "Bajo"
-        elif score_riesgo < 66:
-            nivel_riesgo = "Medio"
+    analisis = st.session_state.get("analisis_conductor")
+    if analisis is not None:
+        if analisis["datos"] != datos_conductor:
+            st.info("ℹ️ Los datos del conductor cambiaron. Presione **Analizar Conductor** para actualizar el análisis.")
         else:
-            nivel_riesgo = "Alto"
-        
-        # --- PCA 2: Experticia ---
-        scaler_exp = StandardScaler()
-        exp_scaled = scaler_exp.fit_transform(datos_completos[cols_experiencia])
-        pca_exp = PCA(n_components=1)
-        exp_pc1 = pca_exp.fit_transform(exp_scaled).flatten()
-        
-        # Verificar dirección (más horas/km/entregas = más experticia)
-        loadings_exp = pca_exp.components_[0]
-        if np.mean(loadings_exp) < 0:
-            exp_pc1 = -exp_pc1
-        
-        score_exp = escalar_0_100(exp_pc1[-1], exp_pc1)
-        
-        if score_exp < 33:
-            nivel_exp = "Junior"
-        elif score_exp < 66:
-            nivel_exp = "Intermedio"
-        else:
-            nivel_exp = "Senior"
-        
-        # --- PCA 3: Seguridad / Fatiga ---
-        seg_df = datos_completos[cols_seguridad].copy()
-        seg_df["asistencia_capacitaciones"] = -seg_df["asistencia_capacitaciones"]
-        
-        scaler_seg = StandardScaler()
-        seg_scaled = scaler_seg.fit_transform(seg_df)
-        pca_seg = PCA(n_components=1)
-        seg_pc1 = pca_seg.fit_transform(seg_scaled).flatten()
-        
-        score_seg = escalar_0_100(seg_pc1[-1], seg_pc1)
-        
-        if score_seg < 33:
-            nivel_seg = "Buena seguridad / baja fatiga"
-        elif score_seg < 66:
-            nivel_seg = "Vigilancia necesaria"
-        else:
-            nivel_seg = "Crítico (alto riesgo / fatiga)"
-        
-        # ================================
-        # CLUSTERING BASADO EN RIESGO Y EXPERTICIA
-        # ================================
-        # Crear matriz de features para clustering (solo Riesgo y Experticia)
-        features_clustering = np.column_stack([riesgo_pc1, exp_pc1])
-        
-        # Aplicar K-Means sobre estos dos componentes
-        n_clusters = 4
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        clusters = kmeans.fit_predict(features_clustering)
-        
-        # Identificar cluster del conductor
-        cluster_conductor = clusters[-1]
-        
-        # ASIGNAR NOMBRES BASADOS EN CENTROIDES
-        centroides = kmeans.cluster_centers_
-        nombres_clusters = {}
-        
-        for i, centroide in enumerate(centroides):
-            riesgo_centroide = centroide[0]
-            exp_centroide = centroide[1]
+            mostrar_analisis_conductor(analisis["resultado"], analisis["datos"])
             
-            # Clasificar según cuadrante
-            if riesgo_centroide < np.median(riesgo_pc1) and exp_centroide > np.median(exp_pc1):
-                nombres_clusters[i] = "🟢 MAESTRO_IDEAL"
-            elif riesgo_centroide < np.median(riesgo_pc1) and exp_centroide < np.median(exp_pc1):
-                nombres_clusters[i] = "🟡 NOVATO_SEGURO"
-            elif riesgo_centroide > np.median(riesgo_pc1) and exp_centroide > np.median(exp_pc1):
-                nombres_clusters[i] = "🟠 EXPERTO_RIESGOSO"
-            else:
-                nombres_clusters[i] = "🔴 NOVATO_RIESGOSO"
-        
-        # ================================
-        # PCA 2D GLOBAL PARA VISUALIZACIÓN
-        # ================================
-        scaler_global = StandardScaler()
-        datos_normalizados_global = scaler_global.fit_transform(datos_completos)
-        pca_global = PCA(n_components=2)
-        datos_pca_global = pca_global.fit_transform(datos_normalizados_global)
-        
-        df_viz = pd.DataFrame({
-            "PC1": datos_pca_global[:, 0],
-            "PC2": datos_pca_global[:, 1],
-            "Cluster": clusters,
-            "Tipo": ["Otros Conductores"] * n_conductores + ["Conductor Actual"]
-        })
-        
-        # ================================
-        # MOSTRAR RESULTADOS
-        # ================================
-        st.subheader("📊 Resultados del Análisis")
-        
-        col_m1, col_m2, col_m3 = st.columns(3)
-        
-        with col_m1:
-            st.metric("🎯 Cluster Asignado", nombres_clusters[cluster_conductor])
-        
-        with col_m2:
-            st.metric("⚠️ Nivel de Riesgo", nivel_riesgo)
-        
-        with col_m3:
-            st.metric("👨‍💼 Nivel de Experticia", nivel_exp)
-        
-        st.markdown("---")
-        
-        # Mostrar los 3 PCA como scores
-        st.markdown("### 🎛 Scores PCA por dimensión")
-        
-        c1, c2, c3 = st.columns(3)
-        
-        with c1:
-            st.metric(
-                "Score de Riesgo (0-100)",
-                f"{score_riesgo:.1f}%",
-                help="Basado en frenadas duras, excesos de velocidad, incidentes con carga e infracciones. Mayor score = Mayor riesgo"
-            )
-            st.write(f"Nivel de riesgo: **{nivel_riesgo}**")
+            # Con métricas cargadas desde telemetría se sugieren ese conductor y mes
+            conductor_sugerido = st.session_state.get("conductor_historial", "")
+            mes_sugerido = datetime.now().strftime("%Y-%m")
+            if almacen_telemetria.existe() and conductor_telemetria and mes_telemetria:
+                conductor_sugerido, mes_sugerido = conductor_telemetria, mes_telemetria
             
-            # Mostrar loadings para transparencia
-            with st.expander("📊 Ver contribución de variables"):
-                for var, loading in zip(cols_riesgo, pca_riesgo.components_[0]):
-                    st.write(f"- {var}: {loading:.3f}")
-        
-        with c2:
-            st.metric(
-                "Score de Experticia (0-100)",
-                f"{score_exp:.1f}%",
-                help="Basado en horas de manejo, km recorridos y entregas realizadas."
-            )
-            st.write(f"Nivel de experticia: **{nivel_exp}**")
-            
-            with st.expander("📊 Ver contribución de variables"):
-                for var, loading in zip(cols_experiencia, pca_exp.components_[0]):
-                    st.write(f"- {var}: {loading:.3f}")
-        
-        with c3:
-            st.metric(
-                "Índice Seguridad / Fatiga (0-100)",
-                f"{score_seg:.1f}%",
-                help="Basado en reclamos, accidentes, capacitaciones y nivel de fatiga."
-            )
-            st.write(f"Situación: **{nivel_seg}**")
-        
+            with st.expander("💾 Guardar en el historial del conductor"):
+                col_g1, col_g2 = st.columns(2)
+                with col_g1:
+                    conductor_guardar = st.text_input("ID del conductor", value=conductor_sugerido)
+                with col_g2:
+                    mes_guardar = st.text_input("Mes (AAAA-MM)", value=mes_sugerido)
+                if st.button("Guardar scores del mes"):
+                    try:
+                        mes_guardar = str(pd.Period(mes_guardar.strip(), "M"))
+                    except ValueError:
+                        mes_guardar = None
+                    if not conductor_guardar.strip() or mes_guardar is None:
+                        st.error("❌ Indique el ID del conductor y un mes AAAA-MM válido")
+                    else:
+                        resultado = analisis["resultado"]
+                        cargar_historial().agregar(tabla_segmentacion(
+                            pd.DataFrame({"conductor": [conductor_guardar.strip()], "mes": [mes_guardar]}),
+                            pd.DataFrame([{k: resultado[k] for k in (
+                                "score_riesgo", "nivel_riesgo", "score_exp", "nivel_exp",
+                                "score_seg", "nivel_seg", "cluster_id", "cluster"
+                            )}])
+                        ))
+                        st.session_state["conductor_historial"] = conductor_guardar.strip()
+                        st.success(f"✅ Scores de {conductor_guardar.strip()} guardados para {mes_guardar}")
+    
+    # ==========================
+    # HISTORIAL DE SCORES
+    # ==========================
+    historial = cargar_historial()
+    if historial.existe():
         st.markdown("---")
-        
-        # Análisis de características del cluster
-        st.markdown("### 🔍 Características del Cluster")
-        
-        mask_cluster = clusters[:-1] == cluster_conductor
-        if mask_cluster.sum() > 0:
-            stats_cluster = datos_simulados[mask_cluster].mean()
-            
-            col_s1, col_s2 = st.columns(2)
-            
-            with col_s1:
-                st.markdown("#### Promedios del Cluster")
-                st.write(f"**Frenadas Duras:** {stats_cluster['frenadas_duras']:.1f}")
-                st.write(f"**Excesos Velocidad:** {stats_cluster['excesos_velocidad']:.1f}")
-                st.write(f"**Incidentes Carga:** {stats_cluster['incidentes_carga']:.1f}")
-                st.write(f"**Infracciones:** {stats_cluster['infracciones']:.1f}")
-                st.write(f"**Accidentes Leves:** {stats_cluster['accidentes_leves']:.1f}")
-            
-            with col_s2:
-                st.markdown("#### Tus Valores")
-                st.write(f"**Frenadas Duras:** {frenadas_duras}")
-                st.write(f"**Excesos Velocidad:** {excesos_velocidad}")
-                st.write(f"**Incidentes Carga:** {incidentes_carga}")
-                st.write(f"**Infracciones:** {infracciones}")
-                st.write(f"**Accidentes Leves:** {accidentes_leves}")
-        
-        # Recomendaciones según cluster
-        st.markdown("### 💡 Recomendaciones")
-        
-        if "MAESTRO_IDEAL" in nombres_clusters[cluster_conductor]:
-            st.success("¡Excelente desempeño! Mantén tus buenos hábitos de conducción y seguridad.")
-        elif "NOVATO_SEGURO" in nombres_clusters[cluster_conductor]:
-            st.info("Buen perfil de seguridad. Aumenta tu experiencia y productividad para avanzar.")
-        elif "EXPERTO_RIESGOSO" in nombres_clusters[cluster_conductor]:
-            st.warning("Alta experiencia pero con comportamientos riesgosos. Reduce infracciones y mejora hábitos de conducción.")
-        else:
-            st.error("Requiere atención inmediata. Necesitas mejorar tanto en experiencia como en seguridad.")
+        st.markdown("### 🗂️ Evolución del conductor")
+        conductor_por_defecto = st.session_state.get("conductor_historial", "")
+        if almacen_telemetria.existe() and conductor_telemetria:
+            conductor_por_defecto = conductor_telemetria
+        conductor_historial = st.text_input(
+            "ID del conductor a consultar",
+            value=conductor_por_defecto,
+            help="Scores mensuales guardados en artefactos/historial_scores (últimos 24 meses)"
+        ).strip()
+        
+        if conductor_historial:
+            trayectoria = historial.ultimos_meses(conductor_historial, 24)
+            if trayectoria.empty:
+                st.info(f"ℹ️ No hay scores guardados para {conductor_historial}.")
+            else:
+                df_trend = trayectoria.melt(
+                    id_vars=["mes"],
+                    value_vars=["score_riesgo", "score_exp", "score_seg"],
+                    var_name="Dimensión",
+                    value_name="Score"
+                ).replace({"Dimensión": {
+                    "score_riesgo": "Riesgo", "score_exp": "Experticia", "score_seg": "Seguridad / Fatiga"
+                }})
+                fig_trend = px.line(df_trend, x="mes", y="Score", color="Dimensión", markers=True)
+                fig_trend.update_layout(height=360, yaxis_range=[0, 100], margin=dict(l=10, r=10, t=10, b=10))
+                st.plotly_chart(fig_trend, use_container_width=True)
+                
+                fig_clusters = px.scatter(
+                    trayectoria.astype({"cluster": str}), x="mes", y="cluster", color="cluster"
+                )
+                fig_clusters.update_traces(marker=dict(size=14, symbol="square"))
+                fig_clusters.update_layout(
+                    height=220, showlegend=False, margin=dict(l=10, r=10, t=10, b=10), yaxis_title=None
+                )
+                st.plotly_chart(fig_clusters, use_container_width=True)
+                
+                cambios = (trayectoria["cluster"].astype(str) != trayectoria["cluster"].astype(str).shift()).sum() - 1
+                st.caption(f"{len(trayectoria)} meses registrados · {cambios} cambios de cluster")
+        
+        meses_historial = historial.meses()
+        if len(meses_historial) >= 2:
+            with st.expander("🔀 Transiciones de cluster de la flota"):
+                col_h1, col_h2 = st.columns(2)
+                with col_h1:
+                    mes_origen = st.selectbox("Desde", options=meses_historial, index=len(meses_historial) - 2)
+                with col_h2:
+                    mes_destino = st.selectbox("Hasta", options=meses_historial, index=len(meses_historial) - 1)
+                st.dataframe(
+                    transiciones_cache(mes_origen, mes_destino, historial.firma()), use_container_width=True
+                )
+                st.caption("Filas: cluster en el mes inicial · Columnas: cluster en el mes final (conductores)")
 
 st.markdown("---")
 st.caption("🔧 Sistema de Análisis de Entregas v3.0 | Hora actual: " + datetime.now().strftime("%H:%M:%S"))
\ No newline at end of file
@@ -0,0 +1,291 @@
+# telemetria.py
+# Ingesta de eventos de telemetría y almacén incremental de métricas
+# mensuales por conductor (las 11 variables del módulo de clustering).
+#
+# Cada archivo de eventos (CSV o Parquet) tiene una fila por evento:
+#   conductor, timestamp, evento, km, horas, fatiga
+# km/horas/fatiga son opcionales y pueden venir vacíos.
+#
+# Uso:
+#   python telemetria.py eventos/2026-10-18.parquet eventos/2026-10-19.csv
+import argparse
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from clustering_conductores import COLUMNAS_CONDUCTOR
+
+DIRECTORIO_TELEMETRIA = Path("artefactos/telemetria")
+
+# Tipo de evento -> métrica mensual que incrementa
+EVENTOS_CONTEO = {
+    "frenada_dura": "frenadas_duras",
+    "exceso_velocidad": "excesos_velocidad",
+    "incidente_carga": "incidentes_carga",
+    "infraccion": "infracciones",
+    "entrega": "entregas_mes",
+    "reclamo": "reclamos_clientes",
+    "accidente_leve": "accidentes_leves",
+    "capacitacion": "asistencia_capacitaciones",
+}
+
+# Agregados parciales que se pueden sumar entre lotes
+COLUMNAS_AGREGADO = list(EVENTOS_CONTEO.values()) + [
+    "km_mes",
+    "horas_manejo_mes",
+    "fatiga_suma",
+    "fatiga_n",
+]
+
+# Agregados que son conteos (se guardan como enteros)
+COLUMNAS_ENTERAS = list(EVENTOS_CONTEO.values()) + ["fatiga_n"]
+
+COLUMNAS_EVENTO = ["conductor", "timestamp", "evento", "km", "horas", "fatiga"]
+CATEGORIAS_EVENTO = pd.CategoricalDtype(list(EVENTOS_CONTEO))
+
+# Cada cuántos bloques de un archivo se suman los agregados parciales
+BLOQUES_POR_PLEGADO = 8
+
+
+def agregar_eventos(eventos):
+    """Agrega un bloque de eventos por (conductor, mes) en una sola pasada.
+
+    Devuelve el agregado y la cantidad de eventos descartados por timestamp
+    ilegible (se omiten, no detienen la ingesta).
+    """
+    eventos = eventos.reindex(columns=COLUMNAS_EVENTO)
+    instantes = pd.to_datetime(eventos["timestamp"], format="ISO8601", errors="coerce")
+    legibles = instantes.notna().to_numpy()
+    descartados = int((~legibles).sum())
+    if descartados:
+        eventos, instantes = eventos[legibles], instantes[legibles]
+    mes = instantes.to_numpy().astype("datetime64[M]")
+    codigos = eventos["evento"].astype(CATEGORIAS_EVENTO).cat.codes.to_numpy()
+
+    # Indicadores por tipo de evento; los tipos desconocidos (código -1) no cuentan
+    conteos = (codigos[:, None] == np.arange(len(EVENTOS_CONTEO))[None, :]).astype(np.int64)
+    fatiga = pd.to_numeric(eventos["fatiga"], errors="coerce").to_numpy(dtype=float)
+
+    parcial = pd.DataFrame(conteos, columns=list(EVENTOS_CONTEO.values()))
+    parcial["km_mes"] = pd.to_numeric(eventos["km"], errors="coerce").fillna(0).to_numpy()
+    parcial["horas_manejo_mes"] = pd.to_numeric(eventos["horas"], errors="coerce").fillna(0).to_numpy()
+    parcial["fatiga_suma"] = np.nan_to_num(fatiga)
+    parcial["fatiga_n"] = (~np.isnan(fatiga)).astype(np.int64)
+    parcial["conductor"] = eventos["conductor"].astype(str).to_numpy()
+    parcial["mes"] = mes
+
+    # Se agrupa por el mes numérico y solo el resultado se pasa a texto "AAAA-MM"
+    agregado = parcial.groupby(["conductor", "mes"], sort=False)[COLUMNAS_AGREGADO].sum().reset_index()
+    agregado["mes"] = np.datetime_as_string(agregado["mes"].to_numpy().astype("datetime64[M]"), unit="M")
+    return agregado.set_index(["conductor", "mes"]), descartados
+
+
+def plegar(agregados):
+    """Suma agregados parciales por (conductor, mes)."""
+    agregados = [a for a in agregados if a is not None]
+    if not agregados:
+        vacio = pd.DataFrame(columns=["conductor", "mes"] + COLUMNAS_AGREGADO)
+        return vacio.set_index(["conductor", "mes"])
+    total = pd.concat(agregados).groupby(level=["conductor", "mes"]).sum()
+    return total.astype({c: np.int64 for c in COLUMNAS_ENTERAS})
+
+
+def leer_eventos(ruta, tam_bloque=1_000_000):
+    """Itera bloques de eventos sin cargar el archivo completo en memoria."""
+    ruta = Path(ruta)
+    if ruta.suffix == ".parquet":
+        archivo = pq.ParquetFile(ruta, memory_map=True)
+        columnas = [c for c in COLUMNAS_EVENTO if c in archivo.schema_arrow.names]
+        for lote in archivo.iter_batches(batch_size=tam_bloque, columns=columnas):
+            yield lote.to_pandas()
+    else:
+        yield from pd.read_csv(
+            ruta,
+            usecols=lambda c: c in COLUMNAS_EVENTO,
+            dtype={"conductor": str, "evento": str},
+            chunksize=tam_bloque,
+        )
+
+
+def agregar_archivo(ruta, tam_bloque=1_000_000):
+    """Agregados de un archivo completo, eventos agregados y eventos descartados.
+
+    Los parciales de cada bloque se suman cada BLOQUES_POR_PLEGADO bloques, así
+    la memoria depende de los conductores del archivo y no de sus eventos.
+    """
+    total = None
+    pendientes = []
+    eventos = 0
+    descartados = 0
+    for bloque in leer_eventos(ruta, tam_bloque):
+        agregado, n_descartados = agregar_eventos(bloque)
+        pendientes.append(agregado)
+        eventos += len(bloque) - n_descartados
+        descartados += n_descartados
+        if len(pendientes) >= BLOQUES_POR_PLEGADO:
+            total = plegar([total] + pendientes)
+            pendientes = []
+    return plegar([total] + pendientes), eventos, descartados
+
+
+def features_desde_agregados(agregados):
+    """Convierte agregados parciales en las métricas que usa el clustering."""
+    features = agregados.reset_index().sort_values(["conductor", "mes"])
+    features["indice_fatiga"] = (
+        features["fatiga_suma"] / features["fatiga_n"].replace(0, np.nan)
+    ).fillna(0.0)
+
+    # Las capacitaciones se cuentan en el año en curso
+    anio = features["mes"].str[:4]
+    features["asistencia_capacitaciones"] = (
+        features.groupby(["conductor", anio])["asistencia_capacitaciones"].cumsum()
+    )
+    return features[["conductor", "mes"] + COLUMNAS_CONDUCTOR].reset_index(drop=True)
+
+
+class AlmacenTelemetria:
+    """Agregados mensuales por conductor, un archivo Parquet por mes.
+
+    Al ingerir un archivo nuevo solo se reescriben los meses que aparecen en
+    él. Los archivos ya ingeridos (misma ruta, tamaño y fecha) se omiten, así
+    que volver a correr la ingesta no duplica conteos. El aporte de cada
+    archivo se guarda en archivos/: si un archivo ya ingerido cambió (p. ej.
+    se le anexaron eventos tardíos), se resta su aporte anterior y se suma el
+    nuevo.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_TELEMETRIA):
+        self.directorio = Path(directorio)
+        self.ruta_manifiesto = self.directorio / "procesados.json"
+        self.directorio_archivos = self.directorio / "archivos"
+
+    def existe(self):
+        return any(self.directorio.glob("mes=*.parquet"))
+
+    def meses(self):
+        return sorted(p.stem.split("=", 1)[1] for p in self.directorio.glob("mes=*.parquet"))
+
+    def firma(self):
+        return tuple((p.name, p.stat().st_mtime) for p in sorted(self.directorio.glob("mes=*.parquet")))
+
+    def _manifiesto(self):
+        if self.ruta_manifiesto.exists():
+            return json.loads(self.ruta_manifiesto.read_text(encoding="utf-8"))
+        return {}
+
+    def _ruta_mes(self, mes):
+        return self.directorio / f"mes={mes}.parquet"
+
+    def _leer_mes(self, mes):
+        ruta = self._ruta_mes(mes)
+        if not ruta.exists():
+            return None
+        return pq.read_table(ruta).to_pandas().set_index(["conductor", "mes"])
+
+    def _ruta_aporte(self, clave):
+        return self.directorio_archivos / f"{hashlib.sha1(clave.encode('utf-8')).hexdigest()[:16]}.parquet"
+
+    def _escribir(self, agregados, ruta):
+        tabla = pa.Table.from_pandas(agregados.reset_index(), preserve_index=False)
+        pq.write_table(tabla, ruta)
+
+    def ingerir(self, rutas, tam_bloque=1_000_000):
+        """Ingiere archivos de eventos y actualiza solo los meses afectados."""
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.directorio_archivos.mkdir(exist_ok=True)
+        manifiesto = self._manifiesto()
+
+        # Cambio neto por (conductor, mes): aporte nuevo de cada archivo menos el anterior
+        cambios = None
+        pendientes = {}
+        archivos = 0
+        eventos = 0
+        descartados = 0
+        for ruta in map(Path, rutas):
+            clave = str(ruta.resolve())
+            estado = ruta.stat()
+            huella = [estado.st_size, estado.st_mtime]
+            if manifiesto.get(clave) == huella:
+                continue
+            aporte, n, n_descartados = agregar_archivo(ruta, tam_bloque)
+            if clave in manifiesto:
+                ruta_anterior = self._ruta_aporte(clave)
+                if not ruta_anterior.exists():
+                    raise ValueError(
+                        f"{ruta} cambió desde su ingesta y no se guardó su aporte anterior; "
+                        "no se puede actualizar sin duplicar conteos"
+                    )
+                anterior = pq.read_table(ruta_anterior).to_pandas().set_index(["conductor", "mes"])
+                cambio = aporte.sub(anterior, fill_value=0)
+            else:
+                cambio = aporte
+            cambios = plegar([cambios, cambio])
+            # Queda pendiente hasta que los meses estén escritos
+            self._escribir(aporte, self._ruta_aporte(clave).with_suffix(".pendiente"))
+            pendientes[clave] = huella
+            archivos += 1
+            eventos += n
+            descartados += n_descartados
+
+        meses_actualizados = []
+        if cambios is not None:
+            for mes, cambios_mes in cambios.groupby(level="mes"):
+                actual = plegar([self._leer_mes(mes), cambios_mes])
+                # Conductores que quedaron sin eventos tras restar un aporte anterior
+                actual = actual[(actual.abs() > 1e-9).any(axis=1)]
+                if actual.empty:
+                    self._ruta_mes(mes).unlink(missing_ok=True)
+                else:
+                    self._escribir(actual, self._ruta_mes(mes))
+                meses_actualizados.append(mes)
+        for clave, huella in pendientes.items():
+            ruta_aporte = self._ruta_aporte(clave)
+            ruta_aporte.with_suffix(".pendiente").replace(ruta_aporte)
+            manifiesto[clave] = huella
+
+        self.ruta_manifiesto.write_text(json.dumps(manifiesto, indent=2), encoding="utf-8")
+        return {
+            "archivos": archivos,
+            "eventos": eventos,
+            "descartados": descartados,
+            "meses_actualizados": meses_actualizados,
+        }
+
+    def agregados(self, meses=None):
+        meses = self.meses() if meses is None else meses
+        tablas = [t for t in (self._leer_mes(m) for m in meses) if t is not None]
+        if not tablas:
+            vacio = pd.DataFrame(columns=["conductor", "mes"] + COLUMNAS_AGREGADO)
+            return vacio.set_index(["conductor", "mes"])
+        return pd.concat(tablas)
+
+    def features(self, anio=None):
+        """Métricas mensuales por conductor, listas para el módulo de clustering."""
+        meses = self.meses()
+        if anio is not None:
+            meses = [m for m in meses if m.startswith(str(anio))]
+        return features_desde_agregados(self.agregados(meses))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta de eventos de telemetría")
+    parser.add_argument("archivos", nargs="+", help="Archivos de eventos (.csv o .parquet)")
+    parser.add_argument("--directorio", default=str(DIRECTORIO_TELEMETRIA))
+    parser.add_argument("--tam-bloque", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    resumen = AlmacenTelemetria(args.directorio).ingerir(args.archivos, args.tam_bloque)
+    print(
+        f"Archivos nuevos: {resumen['archivos']} | Eventos: {resumen['eventos']:,} | "
+        f"Descartados por timestamp ilegible: {resumen['descartados']:,} | "
+        f"Meses actualizados: {', '.join(resumen['meses_actualizados']) or 'ninguno'}"
+    )
+
+
+if __name__ == "__main__":
+    main()
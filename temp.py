@@ -1,6 +1,8 @@
 import pandas as pd
 import joblib
 
+from esquema import VALIDADOR_ENVIO
+
 # Cargar el modelo entrenado
 pipe = joblib.load("modelo_entregas_mlp.pkl")
 
@@ -22,6 +24,13 @@ nueva_entrada = pd.DataFrame([{
     "HorarioSalida": "Noche",
 }])
 
+# Validar y normalizar antes de predecir: una categoría desconocida
+# no debe llegar al modelo, que la ignoraría en silencio
+validacion = VALIDADOR_ENVIO.validar(nueva_entrada)
+if validacion.n_invalidas:
+    raise ValueError("Entrada inválida: " + "; ".join(validacion.mensajes(0)))
+nueva_entrada = validacion.filas_validas()
+
 # Realizar predicción
 pred = pipe.predict(nueva_entrada)        # 0 o 1
 prob = pipe.predict_proba(nueva_entrada)  # probabilidad